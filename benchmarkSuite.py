@@ -0,0 +1,348 @@
+"""Timings of the import, query, plot and table paths on synthetic data.
+
+    python benchmarkSuite.py --out before.json
+    python benchmarkSuite.py --out after.json --compare before.json
+
+Exports and databases are generated with capstoneGenerator in a scratch
+directory (--work keeps them). Measured:
+
+  ingest  rows/s of import_csv (File > Add CSV) and import_batch (Add folder)
+  query   per table size: the first page of the query table, a random hour,
+          a random day and the whole table through read_columns
+  plot    per table size: the window fetch of a plot over the whole table
+          from SQL, from the result cache and from the column files, then
+          the min/max decimation and drawing into an offscreen PlotWidget
+  model   data() calls per second of PandasModel and SqlTableModel while
+          scrolling and at random, and the time to sort PandasModel
+
+Times are the median and 95th percentile of --repeat runs in ms. Qt runs on
+the offscreen platform, so no display is needed. The JSON also records the
+versions and the git commit, and --compare prints the change of every time
+and rate against an earlier result.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import PYQT_VERSION_STR, Qt
+from PyQt5.QtWidgets import QApplication
+
+import capstoneGenerator
+import capstoneImport
+import downsample
+import turbineQuery
+from bulkWriter import BulkWriter
+from columnStore import ColumnStore
+from connectionManager import ConnectionManager
+from pandasModel import PandasModel
+from resultCache import ResultCache
+from sqlTableModel import PAGE_ROWS, SqlTableModel, read_page
+
+TABLE = 'MT125'
+SIZES = [10000, 100000, 1000000]
+INGEST_ROWS = 200000
+BATCH_FILES = 4
+DUPLICATES = 0.01
+REPEAT = 5
+PLOT_CHANNELS = ['EngineSpeed', 'MainGenPower', 'TurbineExitTemp']
+# Plot width in pixels; main.py asks for about one bucket per pixel
+PLOT_PIXELS = 1000
+# Rows on screen at once in the table view
+VIEW_ROWS = 40
+MODEL_ROWS = 20000
+RANDOM_CELLS = 20000
+
+
+def log(text):
+    print(text, file=sys.stderr, flush=True)
+
+
+def timed(run, repeat):
+    """Median and 95th percentile in ms of repeat calls of run()."""
+    times = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - began) * 1000)
+    times.sort()
+    return {'median_ms': round(statistics.median(times), 3),
+            'p95_ms': round(times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))], 3)}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'pyqt': PYQT_VERSION_STR,
+    }
+
+
+def bench_ingest(work, rows, duplicates, files):
+    """Import one generated export, then the same rows split over files exports."""
+    path = os.path.join(work, f'{TABLE}_ingest.csv')
+    began = time.perf_counter()
+    capstoneGenerator.write_export(path, rows, duplicates=duplicates)
+    generated = time.perf_counter() - began
+    db = os.path.join(work, 'ingest.db')
+    report = capstoneImport.import_csv(path, db, TABLE)
+    single = {'rows': report.stored, 'duplicates': report.duplicates, 'seconds': round(report.elapsed, 3),
+              'rows_per_s': round(report.rows_per_second)}
+
+    paths = []
+    step = rows // files
+    for i in range(files):
+        paths.append(os.path.join(work, f'{TABLE}_part{i}.csv'))
+        # Куски идут подряд по времени, как выгрузки за соседние периоды
+        start = np.datetime64(capstoneGenerator.START) + np.timedelta64(i * step * capstoneGenerator.STEP_MS, 'ms')
+        capstoneGenerator.write_export(paths[-1], step, start=str(start), duplicates=duplicates, seed=i)
+    db = os.path.join(work, 'batch.db')
+    began = time.perf_counter()
+    reports = capstoneImport.import_batch(paths, db, TABLE)
+    elapsed = time.perf_counter() - began
+    stored = sum(report.stored for report in reports)
+    batch = {'files': files, 'rows': stored, 'seconds': round(elapsed, 3), 'rows_per_s': round(stored / elapsed)}
+    return {'generate_s': round(generated, 3), 'import_csv': single, 'import_batch': batch}
+
+
+def build_database(path, rows):
+    """Database with TABLE holding rows generated rows; returns (first, last) epoch ms."""
+    frame = capstoneGenerator.generate(rows)
+    with BulkWriter(path) as writer:
+        for low in range(0, rows, capstoneImport.CHUNK_SIZE):
+            writer.write(TABLE, frame.iloc[low:low + capstoneImport.CHUNK_SIZE])
+    stamps = frame.DateTime.to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    return int(stamps[0]), int(stamps[-1])
+
+
+def random_windows(rng, first, last, span, count):
+    starts = rng.integers(first, max(first, last - span) + 1, count)
+    return [(int(start), int(start) + span) for start in starts]
+
+
+def bench_query(con, first, last, repeat, rng):
+    channels = list(capstoneImport.COLUMNS.values())
+
+    def first_page():
+        # То же, что делает draw_query до показа таблицы
+        level = turbineQuery.pick_level(con, TABLE, first, last, turbineQuery.QUERY_POINTS)
+        read_page(con, turbineQuery.range_sql(TABLE, channels, level), (first, last))
+        turbineQuery.count_range(con, TABLE, first, last, level)
+
+    result = {'first_page': timed(first_page, repeat)}
+    for name, span in (('hour', 3600 * 1000), ('day', 24 * 3600 * 1000)):
+        windows = iter(random_windows(rng, first, last, span, repeat))
+        result[name] = timed(lambda: turbineQuery.read_columns(con, TABLE, channels, *next(windows)), repeat)
+    result['all'] = timed(lambda: turbineQuery.read_columns(con, TABLE, channels, first, last), repeat)
+    result['all_level'] = turbineQuery.pick_level(con, TABLE, first, last, turbineQuery.QUERY_POINTS)
+    return result
+
+
+def bench_plot(path, con, first, last, repeat):
+    buckets = PLOT_PIXELS * downsample.POINTS_PER_PIXEL // 2
+    result = {'sql': timed(lambda: turbineQuery.SeriesWindow(TABLE, PLOT_CHANNELS).fetch(
+        con, first, last, buckets), repeat)}
+    cache = ResultCache()
+    turbineQuery.SeriesWindow(TABLE, PLOT_CHANNELS, cache).fetch(con, first, last, buckets)
+    result['cache_hit'] = timed(lambda: turbineQuery.SeriesWindow(TABLE, PLOT_CHANNELS, cache).fetch(
+        con, first, last, buckets), repeat)
+
+    store = ColumnStore.create(path)
+    began = time.perf_counter()
+    store.build(con)
+    result['build_columns_ms'] = round((time.perf_counter() - began) * 1000, 3)
+    source = turbineQuery.SeriesWindow(TABLE, PLOT_CHANNELS, columns=store)
+    result['columns'] = timed(lambda: source.fetch(con, first, last, buckets), repeat)
+    source.load(con, first, last, buckets)
+    result['points'] = len(source.x)
+
+    def decimate():
+        return [downsample.minmax(source.x, source.ys[name], buckets) for name in PLOT_CHANNELS]
+
+    result['downsample'] = timed(decimate, repeat)
+    result['draw'] = bench_draw(decimate(), repeat)
+    return result
+
+
+def bench_draw(series, repeat):
+    """setData of decimated curves and one paint of an offscreen plot."""
+    import pyqtgraph as pg
+    from timeAxisItem import TimeAxisItem
+    plot = pg.PlotWidget(axisItems={'bottom': TimeAxisItem(orientation='bottom')})
+    plot.resize(PLOT_PIXELS, 400)
+    curves = [plot.plot() for _ in series]
+
+    def draw():
+        for curve, (x, y) in zip(curves, series):
+            curve.setData(x, y)
+        plot.grab()
+
+    result = timed(draw, repeat)
+    plot.deleteLater()
+    return result
+
+
+def scroll(model, rows):
+    """data() for every cell of the first rows, a screen at a time as the view asks; returns cells."""
+    columns = model.columnCount()
+    done = 0
+    for top in range(0, rows, VIEW_ROWS):
+        while model.rowCount() < top + VIEW_ROWS and model.canFetchMore():
+            model.fetchMore()
+        for row in range(top, min(top + VIEW_ROWS, model.rowCount())):
+            for column in range(columns):
+                model.data(model.index(row, column), Qt.DisplayRole)
+                done += 1
+    return done
+
+
+def rate(run):
+    began = time.perf_counter()
+    cells = run()
+    return round(cells / (time.perf_counter() - began))
+
+
+def bench_model(db, first, last, rows, repeat, rng):
+    frame = capstoneGenerator.generate(rows)
+    model = PandasModel(frame)
+    result = {'rows': rows, 'pandas_scroll_cells_per_s': rate(lambda: scroll(model, min(rows, MODEL_ROWS)))}
+    cells = list(zip(rng.integers(0, rows, RANDOM_CELLS).tolist(),
+                     rng.integers(0, model.columnCount(), RANDOM_CELLS).tolist()))
+
+    def random_cells():
+        for row, column in cells:
+            model.data(model.index(row, column), Qt.DisplayRole)
+        return len(cells)
+
+    result['pandas_random_cells_per_s'] = rate(random_cells)
+    result['pandas_sort'] = timed(lambda: model.arrange(('MainGenPower', True)), repeat)
+
+    sql = turbineQuery.range_sql(TABLE, list(capstoneImport.COLUMNS.values()))
+
+    def sql_scroll():
+        table = SqlTableModel(db, sql, read_page(db.reader(), sql, (first, last)), (first, last))
+        return scroll(table, min(rows, MODEL_ROWS))
+
+    result['sql_scroll_cells_per_s'] = rate(sql_scroll)
+    result['sql_page_rows'] = PAGE_ROWS
+    return result
+
+
+def run(args):
+    work = args.work or tempfile.mkdtemp(prefix='turbinist-bench-')
+    os.makedirs(work, exist_ok=True)
+    # Держим ссылку: без QApplication нельзя создать PlotWidget
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    rng = np.random.default_rng(args.seed)
+    results = {'environment': environment(),
+               'settings': {'sizes': args.sizes, 'ingest_rows': args.rows, 'duplicates': args.duplicates,
+                            'repeat': args.repeat, 'seed': args.seed},
+               'query': {}, 'plot': {}}
+    try:
+        if args.rows:
+            log(f'ingest: {args.rows:,} rows')
+            results['ingest'] = bench_ingest(work, args.rows, args.duplicates, BATCH_FILES)
+        for size in args.sizes:
+            path = os.path.join(work, f'size{size}.db')
+            log(f'{size:,} rows: building the table')
+            first, last = build_database(path, size)
+            db = ConnectionManager(path)
+            try:
+                con = db.reader()
+                log(f'{size:,} rows: query')
+                results['query'][str(size)] = bench_query(con, first, last, args.repeat, rng)
+                log(f'{size:,} rows: plot')
+                results['plot'][str(size)] = bench_plot(path, con, first, last, args.repeat)
+                if size == max(args.sizes):
+                    log(f'{size:,} rows: table models')
+                    results['model'] = bench_model(db, first, last, size, args.repeat, rng)
+            finally:
+                db.close()
+    finally:
+        if not args.work:
+            shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def flatten(result, prefix=''):
+    """Nested result -> {'plot.100000.sql.median_ms': value, ...} for the times and rates."""
+    flat = {}
+    for key, value in result.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and key.endswith(('_ms', '_s')):
+            flat[name] = value
+    return flat
+
+
+def compare(base, new, out=None):
+    """Print every time and rate present in both results with its change; slower is flagged."""
+    out = out or sys.stderr
+    before, after = flatten(base), flatten(new)
+    if base.get('settings') != new.get('settings'):
+        print(f'Settings differ: {base.get("settings")} vs {new.get("settings")}', file=out)
+    print(f'{"":60} {"before":>12} {"after":>12} {"change":>8}', file=out)
+    for name in before:
+        if name not in after or not before[name]:
+            continue
+        change = after[name] / before[name] - 1
+        # Для rows/s и cells/s больше - лучше, для времён - меньше
+        worse = change < 0 if name.endswith('per_s') else change > 0
+        flag = '  slower' if worse and abs(change) >= 0.1 else ''
+        print(f'{name:60} {before[name]:12,.3f} {after[name]:12,.3f} {change:+8.1%}{flag}', file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark import, query, plot and table model paths.')
+    parser.add_argument('--sizes', type=lambda text: [int(size) for size in text.split(',')], default=SIZES,
+                        help=f'table sizes in rows, comma-separated (default {",".join(map(str, SIZES))})')
+    parser.add_argument('--rows', type=int, default=INGEST_ROWS,
+                        help=f'rows of the import benchmark, 0 to skip it (default {INGEST_ROWS})')
+    parser.add_argument('--duplicates', type=float, default=DUPLICATES,
+                        help=f'share of repeated rows in the exports (default {DUPLICATES})')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help=f'runs per timing (default {REPEAT})')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work', help='keep generated files in this directory (default: a temporary one)')
+    parser.add_argument('--out', help='write the JSON here (default: standard output)')
+    parser.add_argument('--compare', metavar='JSON', help='earlier result to compare against')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import sqlite3
+
+import numpy as np
+
+import turbineSchema
+from columnStore import ColumnStore, database_path
+from perfTrace import span
+
+# Pragmas applied for the duration of a bulk load
+LOAD_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -256000),
+    ('temp_store', 'MEMORY'),
+]
+# Safe settings restored when the load is over; WAL stays on
+SAFE_PRAGMAS = [
+    ('synchronous', 'FULL'),
+    ('cache_size', -2000),
+    ('temp_store', 'DEFAULT'),
+]
+
+BATCH_ROWS = 500000
+
+
+def merge_ranges(ranges):
+    """Merge overlapping (start, end) ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class BulkWriter:
+    """Append DataFrames to SQLite with executemany in large transactions.
+
+    db is a database path or an open connection in autocommit mode
+    (isolation_level=None). Use as a context manager: load pragmas are applied
+    on enter, and on exit the open transaction is committed and safe pragmas
+    are restored; a connection opened from a path is then closed. Tables are created in the managed schema (see
+    turbineSchema); rows whose DateTime is already stored are skipped, and the
+    rollup buckets covering each written range are refreshed before commit.
+    If the database has a column sidecar (see columnStore), committed rows
+    are appended to it too. When they do not come after the rows it already
+    has, the table's sidecar is invalidated and rebuilt once on exit.
+    """
+
+    def __init__(self, db, batch_rows=BATCH_ROWS):
+        self.db = db
+        self.batch_rows = batch_rows
+        self.con = None
+        self._pending = 0
+        self._tables = set()
+        self._dirty = {}
+        self.columns = None
+        self._appends = {}
+        self._stale = set()
+
+    def __enter__(self):
+        if isinstance(self.db, sqlite3.Connection):
+            self.con = self.db
+        else:
+            self.con = sqlite3.connect(self.db, isolation_level=None)
+        for name, value in LOAD_PRAGMAS:
+            self.con.execute(f'PRAGMA {name} = {value}')
+        self.columns = ColumnStore.open(database_path(self.con))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+                self._rebuild_columns()
+            elif self.con.in_transaction:
+                self.con.execute('ROLLBACK')
+                self._appends.clear()
+            for name, value in SAFE_PRAGMAS:
+                self.con.execute(f'PRAGMA {name} = {value}')
+        finally:
+            if self.con is not self.db:
+                self.con.close()
+            self.con = None
+
+    def ensure_table(self, table):
+        """Create table in the managed schema, migrating a legacy one first."""
+        if table in self._tables:
+            return
+        if turbineSchema.table_exists(self.con, table):
+            if not turbineSchema.is_managed(self.con, table):
+                self.commit()
+                turbineSchema.migrate_table(self.con, table)
+        else:
+            self.begin()
+            turbineSchema.create_table(self.con, table)
+        self.begin()
+        if turbineSchema.create_rollups(self.con, table):
+            turbineSchema.rebuild_rollups(self.con, table)
+        self._tables.add(table)
+
+    def begin(self):
+        if not self.con.in_transaction:
+            self.con.execute('BEGIN')
+
+    def commit(self):
+        """Refresh the rollups of what was written, then commit."""
+        with span('rollup'):
+            for table, ranges in self._dirty.items():
+                for start, end in merge_ranges(ranges):
+                    turbineSchema.refresh_rollups(self.con, table, start, end, from_minutes=True)
+        self._dirty.clear()
+        if self.con.in_transaction:
+            with span('commit'):
+                self.con.execute('COMMIT')
+        self._pending = 0
+        self._update_columns()
+
+    def _update_columns(self):
+        appends, self._appends = self._appends, {}
+        for table, parts in appends.items():
+            if table in self._stale:
+                continue
+            stamps = np.concatenate([part[0] for part in parts])
+            columns = {name: np.concatenate([part[1][name] for part in parts]) for name in parts[0][1]}
+            try:
+                appended = self.columns.append(table, stamps, columns)
+            except OSError:
+                # Файлы заняты или диск полон - графики возьмут данные из базы
+                appended = False
+            if not appended:
+                # Дозапись старых строк: пересобираем таблицу один раз в конце загрузки, а не на каждом commit
+                self.columns.invalidate(table)
+                self._stale.add(table)
+
+    def _rebuild_columns(self):
+        stale, self._stale = self._stale, set()
+        for table in sorted(stale):
+            try:
+                self.columns.rebuild(self.con, table)
+            except OSError:
+                self.columns.invalidate(table)
+
+    def write(self, table, frame):
+        """Insert frame into table; returns the number of rows skipped as already stored."""
+        self.ensure_table(table)
+        self.begin()
+        total = len(frame)
+        with span('insert'):
+            stamps = turbineSchema.to_epoch_ms(frame.DateTime)
+            if len(stamps):
+                # Читаем из БД только ключи в диапазоне чанка и отбрасываем уже сохранённые строки
+                stored = self.con.execute(f'SELECT DateTime FROM "{table}" WHERE DateTime BETWEEN ? AND ?',
+                                          (int(stamps.min()), int(stamps.max()))).fetchall()
+                if stored:
+                    new = ~np.isin(stamps, np.array(stored, dtype=np.int64).ravel())
+                    frame, stamps = frame[new], stamps[new]
+            columns = list(frame.columns)
+            sql = (f'INSERT OR IGNORE INTO "{table}" ({", ".join(columns)}) '
+                   f'VALUES ({", ".join("?" * len(columns))})')
+            values = []
+            for name in columns:
+                column = frame[name]
+                if column.dtype.kind == 'M':
+                    values.append(stamps.tolist())
+                else:
+                    # NaN -> NULL, numpy scalars -> Python objects sqlite3 can bind
+                    values.append(column.astype(object).where(column.notna(), None).tolist())
+            before = self.con.total_changes
+            self.con.executemany(sql, zip(*values))
+            inserted = self.con.total_changes - before
+        if len(stamps):
+            with span('rollup'):
+                turbineSchema.merge_minutes(self.con, table, stamps, frame)
+            self._dirty.setdefault(table, []).append((int(stamps.min()), int(stamps.max())))
+            if self.columns is not None:
+                self._appends.setdefault(table, []).append((stamps, {
+                    name: frame[name].to_numpy(dtype=np.float64, na_value=np.nan)
+                    for name in columns if name in turbineSchema.CHANNELS}))
+        self._pending += total
+        if self._pending >= self.batch_rows:
+            self.commit()
+        return total - inserted
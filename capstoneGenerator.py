@@ -0,0 +1,121 @@
+"""Synthetic Capstone exports for benchmarks and import testing.
+
+    python capstoneGenerator.py MT125_synthetic.csv --rows 1000000 --duplicates 0.01
+
+The file looks like what the Capstone software writes and capstoneImport
+reads: a 6-line preamble, the export column names, m/d/Y dates and cp1251
+encoding. Values follow a turbine that starts, runs near full power for a
+while and stops. The same seed gives the same file.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from capstoneImport import COLUMNS, DATE_COLUMN, TIME_COLUMN
+
+START = '2021-03-01'
+STEP_MS = 1000
+# Rows per run of the turbine, between stops
+RUN_ROWS = 20000
+# Rows formatted per write
+CHUNK_ROWS = 100000
+
+PREAMBLE = [
+    'Capstone Turbine Corporation',
+    'Data Export',
+    'Model: C65',
+    'Serial Number: 0000-SYNTHETIC',
+    'Firmware Version: 5.0',
+    'Sample Interval: {step}',
+]
+
+
+def generate(rows, start=START, step_ms=STEP_MS, duplicates=0.0, seed=0):
+    """Rows of a synthetic export as a frame with the DB column names.
+
+    DateTime is datetime64 and advances step_ms per row. A duplicates share
+    of the rows repeats the row before it, as overlapping exports do, so
+    rows - round(rows * duplicates) distinct times remain.
+    """
+    rng = np.random.default_rng(seed)
+    repeated = int(round(rows * duplicates))
+    distinct = rows - repeated
+    time = np.datetime64(start, 'ms') + np.arange(distinct, dtype=np.int64) * step_ms
+    # Пуск-работа-останов: мощность по трапеции внутри каждого цикла
+    phase = np.arange(distinct) % RUN_ROWS / RUN_ROWS
+    load = np.clip(np.minimum(phase, 0.9 - phase) * 10, 0, 1)
+    noise = rng.standard_normal((8, distinct))
+    power = load * 65000 + noise[0] * 300 * load
+    current = np.maximum(power / 690 + noise[1:5] * 0.5, 0)
+    starts = 100 + np.arange(distinct) // RUN_ROWS
+    frame = pd.DataFrame({
+        'DateTime': time,
+        'IncidentRecord': 1000 + np.arange(distinct) // (RUN_ROWS * 5),
+        'EngineSpeed': (load * 51000 + 45000 + noise[5] * 50) * (load > 0),
+        'MainGenPower': power,
+        'TurbineExitTemp': 20 + load * 625 + noise[6] * 2,
+        'FuelValveCommand': np.maximum(load * 80 + noise[7], 0),
+        'FuelInletPres': 450 + noise[7] * 5,
+        'BatSOC': 90 - 10 * phase,
+        'SecBatSOC': 92 - 10 * phase,
+        'Starts': starts,
+        'Hours': 12000 + np.cumsum(load > 0) * step_ms / 3.6e6,
+        'OutCurA': current[0],
+        'OutCurB': current[1],
+        'OutCurC': current[2],
+        'OutCurN': np.abs(current[3] - current[0]),
+    })
+    if repeated:
+        index = np.sort(np.concatenate([np.arange(distinct), rng.choice(distinct, repeated)]))
+        frame = frame.iloc[index].reset_index(drop=True)
+    return frame
+
+
+def time_texts(stamps):
+    """datetime64[ms] values -> Capstone date and time strings as two lists."""
+    days = stamps.astype('datetime64[D]')
+    # Дат немного, поэтому каждую форматируем один раз
+    unique, inverse = np.unique(days, return_inverse=True)
+    dates = [day.item().strftime('%m/%d/%Y') for day in unique]
+    ms = (stamps - days).astype(np.int64)
+    seconds = (ms // 1000).tolist()
+    times = [f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in seconds]
+    if (ms % 1000).any():
+        times = [f'{text}.{part:03d}' for text, part in zip(times, (ms % 1000).tolist())]
+    return [dates[i] for i in inverse.tolist()], times
+
+
+def write_rows(out, frame, chunk=CHUNK_ROWS):
+    """Write the rows of a DB-named frame (see generate) as Capstone CSV lines."""
+    names = list(COLUMNS.values())
+    # Целые каналы пишем как есть, вещественные - с двумя знаками, как в экспорте
+    line = ','.join(['%s', '%s'] + ['%d' if frame[name].dtype.kind in 'iu' else '%.2f' for name in names]) + '\r\n'
+    for low in range(0, len(frame), chunk):
+        part = frame.iloc[low:low + chunk]
+        columns = list(time_texts(part.DateTime.to_numpy(dtype='datetime64[ms]')))
+        columns.extend(part[name].tolist() for name in names)
+        out.write(''.join(line % row for row in zip(*columns)))
+
+
+def write_export(path, rows, start=START, step_ms=STEP_MS, duplicates=0.0, seed=0):
+    """Write a synthetic Capstone export to path; returns the frame written (DB names)."""
+    frame = generate(rows, start, step_ms, duplicates, seed)
+    with open(path, 'w', encoding='cp1251', newline='') as out:
+        for line in PREAMBLE:
+            out.write(line.format(step=f'{step_ms / 1000:g} s') + '\r\n')
+        out.write(','.join([DATE_COLUMN, TIME_COLUMN] + list(COLUMNS)) + '\r\n')
+        write_rows(out, frame)
+    return frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic Capstone CSV export.')
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--start', default=START, help=f'first time, YYYY-MM-DD[THH:MM:SS] (default {START})')
+    parser.add_argument('--step', type=int, default=STEP_MS, help=f'ms between rows (default {STEP_MS})')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='share of repeated rows, 0..1')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_export(args.path, args.rows, args.start, args.step, args.duplicates, args.seed)
@@ -0,0 +1,337 @@
+import glob
+import multiprocessing
+import os
+import pickle
+import re
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+import perfTrace
+from bulkWriter import BulkWriter
+from perfTrace import span
+
+# Capstone export column -> DB column
+COLUMNS = {
+    'Incident Record ': 'IncidentRecord',
+    'Engine Speed (rpm)': 'EngineSpeed',
+    'Main Gen Power (W)': 'MainGenPower',
+    'Turbine Exit Temp (°C)': 'TurbineExitTemp',
+    'Fuel Valve Command (%)': 'FuelValveCommand',
+    'Fuel Inlet Pres (kPa)': 'FuelInletPres',
+    'Bat SOC (%)': 'BatSOC',
+    'Sec Bat SOC (%)': 'SecBatSOC',
+    'Starts ': 'Starts',
+    'Hours ': 'Hours',
+    'Output Current Phase A (A)': 'OutCurA',
+    'Output Current Phase B (A)': 'OutCurB',
+    'Output Current Phase C (A)': 'OutCurC',
+    'Output Current Neutral (A)': 'OutCurN',
+}
+DATE_COLUMN = 'Control Date '
+TIME_COLUMN = 'Control Time '
+
+DATA_LIST = ['DateTime'] + list(COLUMNS.values())
+
+# Capstone date/time layouts, most common first; the rest cover locale variants
+DATETIME_FORMATS = [
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M:%S.%f',
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M:%S.%f',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+]
+FORMAT_SAMPLE = 1000
+
+TABLE_PATTERN = re.compile(r'MT\d+', re.IGNORECASE)
+
+CHUNK_SIZE = 100000
+
+
+class ImportReport:
+    """Counters collected while importing one file."""
+
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self.rows = 0
+        self.duplicates = 0
+        self.parse_failures = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+        # Текст ошибки, если файл не удалось разобрать (см. import_batch)
+        self.error = None
+        # Время по этапам, если файл разбирался в другом процессе (см. parse_file)
+        self.stages = {}
+
+    @property
+    def stored(self):
+        """Rows written to the table: rows read, minus those already in the database."""
+        return self.rows - self.skipped
+
+    @property
+    def rows_per_second(self):
+        """Stored rows per second."""
+        return self.stored / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        if self.error is not None:
+            return f'{self.path} -> {self.table}: FAILED - {self.error}'
+        return (f'{self.path} -> {self.table}: {self.stored} rows stored of {self.rows} read, '
+                f'{self.duplicates} duplicates, {self.skipped} already in DB, {self.parse_failures} unparsed, {self.elapsed:.1f} s '
+                f'({self.rows_per_second:,.0f} rows/s)')
+
+
+def read_chunks(path, chunksize=CHUNK_SIZE, columns=None):
+    """Iterate over a Capstone export in frames of at most chunksize rows."""
+    return pd.read_csv(path, sep=',', header=6, encoding='cp1251', index_col=False,
+                       usecols=columns or [DATE_COLUMN, TIME_COLUMN] + list(COLUMNS),
+                       chunksize=chunksize)
+
+
+def month_first(fmt):
+    return fmt.index('%m') < fmt.index('%d')
+
+
+def swapped(fmt):
+    """The same layout with day and month exchanged: m/d/Y <-> d/m/Y."""
+    return fmt.replace('%m', '%_').replace('%d', '%m').replace('%_', '%d')
+
+
+def detect_format(values):
+    """Return (fmt, settled): the format in DATETIME_FORMATS that parses most of values.
+
+    m/d/Y and d/m/Y both read a date whose day is 12 or less, so the scoring
+    sample is a head of values plus one value per distinct date. If the day
+    and month order is still open (settled is False), fmt is the month-first
+    one, as Capstone writes it.
+    """
+    values = values.dropna()
+    if values.empty:
+        return DATETIME_FORMATS[0], False
+    dates = values.str.partition(' ')[0]
+    sample = pd.concat([values.head(FORMAT_SAMPLE), values[~dates.duplicated()]])
+    scores = {fmt: pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum() for fmt in DATETIME_FORMATS}
+    fmt = max(DATETIME_FORMATS, key=scores.get)
+    other = swapped(fmt)
+    if other in scores and scores[other] == scores[fmt]:
+        return (fmt if month_first(fmt) else other), False
+    return fmt, True
+
+
+def scan_format(path, chunksize=CHUNK_SIZE):
+    """Detect the format of a whole export, reading only its date and time columns.
+
+    Reading stops at the first chunk that settles the day and month order.
+    """
+    fmt = None
+    for chunk in read_chunks(path, chunksize, [DATE_COLUMN, TIME_COLUMN]):
+        fmt, settled = detect_format(datetime_strings(chunk))
+        if settled:
+            break
+    return fmt or DATETIME_FORMATS[0]
+
+
+def parse_datetime(values, fmt=None):
+    """Parse 'date time' strings with an explicit format.
+
+    Rows that fail fmt are retried with the other DATETIME_FORMATS of the
+    same day and month order, so a m/d/Y file is never read as d/m/Y;
+    whatever is still unparsed comes back as NaT.
+    """
+    if fmt is None:
+        fmt = detect_format(values)[0]
+    result = pd.to_datetime(values, format=fmt, errors='coerce')
+    for other in DATETIME_FORMATS:
+        failed = result.isna() & values.notna()
+        if not failed.any():
+            break
+        if other != fmt and month_first(other) == month_first(fmt):
+            result[failed] = pd.to_datetime(values[failed], format=other, errors='coerce')
+    return result
+
+
+def datetime_strings(df):
+    """Join the Capstone date and time columns into 'date time' strings."""
+    return df[DATE_COLUMN].astype(str).str.strip() + ' ' + df[TIME_COLUMN].astype(str).str.strip()
+
+
+def normalize_chunk(df, fmt=None):
+    """Rename the Capstone columns and derive DateTime for one chunk.
+
+    Returns the normalized frame and the number of rows whose DateTime
+    could not be parsed; those rows are dropped.
+    """
+    df = df.rename(columns=COLUMNS)
+    df['DateTime'] = parse_datetime(datetime_strings(df), fmt)
+    df = df[DATA_LIST]
+    parsed = df.DateTime.notna()
+    return df[parsed], len(df) - int(parsed.sum())
+
+
+def iter_chunks(path, report, chunksize=CHUNK_SIZE):
+    """Yield normalized, de-duplicated chunks of one export, updating report."""
+    previous = pd.Series(dtype='datetime64[ns]')
+    fmt = None
+    chunks = read_chunks(path, chunksize)
+    while True:
+        with span('read'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        if chunk.empty:
+            # Выгрузка из одной шапки
+            continue
+        with span('parse'):
+            if fmt is None:
+                # Формат определяем по первому чанку и используем для всего файла;
+                # если день и месяц в нем не различить, смотрим даты дальше по файлу
+                fmt, settled = detect_format(datetime_strings(chunk))
+                if not settled:
+                    fmt = scan_format(path, chunksize)
+            chunk, failures = normalize_chunk(chunk, fmt)
+        report.parse_failures += failures
+        # Удаляем дубликаты по DateTime, в том числе на стыке соседних чанков
+        size = len(chunk)
+        with span('dedupe'):
+            chunk = chunk.drop_duplicates(subset=['DateTime'], keep='first')
+            chunk = chunk[~chunk.DateTime.isin(previous)]
+        report.duplicates += size - len(chunk)
+        previous = chunk.DateTime
+        report.rows += len(chunk)
+        yield chunk
+
+
+def write_chunks(writer, table, chunks):
+    """Append frames to table through writer; returns the rows already stored."""
+    return sum(writer.write(table, frame) for frame in chunks)
+
+
+def import_csv(path, db, table, chunksize=CHUNK_SIZE, progress=None):
+    """Stream a Capstone export into table of db (a path or a connection, see BulkWriter).
+
+    Chunks are committed in batches (see BulkWriter). progress, if given, is
+    called as progress(report) after every chunk.
+    """
+    report = ImportReport(path, table)
+    start = time.perf_counter()
+    with BulkWriter(db) as writer:
+        for chunk in iter_chunks(path, report, chunksize):
+            report.skipped += writer.write(table, chunk)
+            report.elapsed = time.perf_counter() - start
+            if progress is not None:
+                progress(report)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def expand_paths(pattern):
+    """Return the exports named by a directory, a glob or a plain path, sorted."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    return sorted(glob.glob(pattern))
+
+
+def table_for(path):
+    """Guess the turbine table (MT125, MT127, ...) from an export's file name."""
+    match = TABLE_PATTERN.search(os.path.basename(path))
+    return match.group(0).upper() if match else None
+
+
+def parse_file(path, table, chunksize=CHUNK_SIZE):
+    """Normalize an export into a temporary file of pickled chunks; runs in a worker process.
+
+    Returns the temporary file's path and the report. Chunks are written as
+    they are parsed, so no process holds a whole export in memory; the
+    caller reads them back with read_spool and removes the file.
+    """
+    report = ImportReport(path, table)
+    start = time.perf_counter()
+    trace = perfTrace.Trace('parse')
+    handle, spool = tempfile.mkstemp(prefix='capstone-', suffix='.chunks')
+    try:
+        with open(handle, 'wb') as out, trace.active():
+            for chunk in iter_chunks(path, report, chunksize):
+                with span('spool'):
+                    pickle.dump(chunk, out, pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        os.remove(spool)
+        raise
+    report.elapsed = time.perf_counter() - start
+    report.stages = trace.stages
+    return spool, report
+
+
+def read_spool(spool):
+    """Yield the chunks parse_file wrote to spool, one at a time."""
+    with open(spool, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def import_batch(paths, db, table=None, workers=None, progress=None):
+    """Import many exports, parsing them in a process pool.
+
+    Parsed files are written one at a time by the calling process, so SQLite
+    only ever sees a single writer. Workers are spawned rather than forked,
+    so the caller may have threads and open connections. table=None picks the table from each file
+    name (see table_for). progress, if given, is called as progress(report)
+    once per file, after it has been written. A file that cannot be parsed
+    does not stop the batch: its report carries the error instead.
+    """
+    jobs = [(path, table or table_for(path)) for path in paths]
+    for path, target in jobs:
+        if target is None:
+            raise ValueError(f'Cannot tell the table for {path}; pass it explicitly')
+    workers = workers or os.cpu_count() or 1
+    reports = []
+    jobs = iter(jobs)
+    # spawn, а не fork: из GUI пул запускается при живых потоках QThreadPool с открытыми соединениями
+    context = multiprocessing.get_context('spawn')
+    pending = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, BulkWriter(db) as writer:
+
+            def submit():
+                # Держим в работе не больше 2 файлов на процесс; разобранные ждут записи на диске, а не в памяти
+                for path, target in jobs:
+                    pending[pool.submit(parse_file, path, target)] = path, target
+                    if len(pending) >= 2 * workers:
+                        break
+
+            submit()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, target = pending.pop(future)
+                    try:
+                        spool, report = future.result()
+                    except Exception as e:
+                        report = ImportReport(path, target)
+                        report.error = str(e) or type(e).__name__
+                    else:
+                        perfTrace.merge(report.stages)
+                        start = time.perf_counter()
+                        try:
+                            report.skipped += write_chunks(writer, report.table, read_spool(spool))
+                        finally:
+                            os.remove(spool)
+                        report.elapsed += time.perf_counter() - start
+                    reports.append(report)
+                    if progress is not None:
+                        progress(report)
+                submit()
+    finally:
+        # Запись прервалась: убираем файлы, которые уже разобраны, но не записаны
+        for future in pending:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                os.remove(future.result()[0])
+    return reports
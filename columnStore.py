@@ -0,0 +1,162 @@
+"""Columnar sidecar of the turbine tables, read by the plots through numpy.memmap.
+
+Next to turbinist.db the directory turbinist.db.columns/<table>/ holds
+DateTime.f8 (epoch seconds) and one <channel>.f8 per channel: plain
+little-endian float64 sorted by time, NULL stored as NaN. meta.json records
+the row count, the last DateTime (ms) and the channels; a table without it
+is not served. The sidecar is optional: it exists once built ("Build column
+files"), and from then on BulkWriter appends every import to it.
+"""
+import json
+import os
+
+import numpy as np
+
+import turbineQuery
+import turbineSchema
+from perfTrace import span
+
+SUFFIX = '.columns'
+DTYPE = np.dtype('<f8')
+TIME_FILE = 'DateTime'
+
+
+def store_path(db_path):
+    return os.path.abspath(db_path) + SUFFIX
+
+
+def database_path(con):
+    """File of the main database of con ('' for an in-memory one)."""
+    for _, name, path in con.execute('PRAGMA database_list'):
+        if name == 'main':
+            return path
+    return ''
+
+
+class ColumnStore:
+    """Sidecar directory of one database (see the module docstring)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def open(cls, db_path):
+        """Store of the database at db_path, or None if none has been built."""
+        if not db_path or not os.path.isdir(store_path(db_path)):
+            return None
+        return cls(store_path(db_path))
+
+    @classmethod
+    def create(cls, db_path):
+        os.makedirs(store_path(db_path), exist_ok=True)
+        return cls(store_path(db_path))
+
+    def _file(self, table, name):
+        return os.path.join(self.path, table, f'{name}.f8')
+
+    def _meta_file(self, table):
+        return os.path.join(self.path, table, 'meta.json')
+
+    def meta(self, table):
+        try:
+            with open(self._meta_file(table)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, table, meta):
+        path = self._meta_file(table)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def invalidate(self, table):
+        """Stop serving table until it is rebuilt."""
+        try:
+            os.remove(self._meta_file(table))
+        except FileNotFoundError:
+            pass
+
+    def read(self, con, table, channels, start, finish):
+        """x in seconds and {channel: y} for [start, finish] ms as memmap slices.
+
+        Returns None when the sidecar cannot serve the request: not built for
+        the table or the channels, or behind the database.
+        """
+        with span('columns'):
+            meta = self.meta(table)
+            if meta is None or not meta['rows'] or not all(name in meta['channels'] for name in channels):
+                return None
+            # Если таблицу писали в обход BulkWriter, файлы отстали от базы
+            if con.execute(f'SELECT MAX(DateTime) FROM "{table}"').fetchone()[0] != meta['last']:
+                return None
+            x = self._map(table, TIME_FILE, meta['rows'])
+            low = int(np.searchsorted(x, start / 1000, side='left'))
+            high = int(np.searchsorted(x, finish / 1000, side='right'))
+            return x[low:high], {name: self._map(table, name, meta['rows'])[low:high] for name in channels}
+
+    def _map(self, table, name, rows):
+        return np.memmap(self._file(table, name), dtype=DTYPE, mode='r', shape=(rows,))
+
+    def append(self, table, stamps, columns):
+        """Add rows given as epoch-ms stamps and {channel: values}.
+
+        Returns False, writing nothing, if the table has no sidecar, the
+        channels differ or the rows do not all come after the stored ones;
+        the table then needs rebuild().
+        """
+        meta = self.meta(table)
+        if meta is None or set(columns) != set(meta['channels']):
+            return False
+        if not len(stamps):
+            return True
+        order = np.argsort(stamps, kind='stable')
+        stamps = stamps[order]
+        if meta['last'] is not None and stamps[0] <= meta['last']:
+            return False
+        rows = meta['rows']
+        # Пока файлы дописываются, таблица не обслуживается
+        self.invalidate(table)
+        with span('columns'):
+            self._extend(table, TIME_FILE, rows, stamps / 1000)
+            for name in meta['channels']:
+                self._extend(table, name, rows, columns[name][order])
+        self._write_meta(table, {'rows': rows + len(stamps), 'last': int(stamps[-1]), 'channels': meta['channels']})
+        return True
+
+    def _extend(self, table, name, rows, values):
+        with open(self._file(table, name), 'r+b') as f:
+            # Отрезаем хвост, оставшийся от прерванной записи
+            f.truncate(rows * DTYPE.itemsize)
+            f.seek(rows * DTYPE.itemsize)
+            f.write(np.asarray(values, dtype=DTYPE).tobytes())
+
+    def rebuild(self, con, table):
+        """Write the sidecar of table from the database."""
+        channels = [name for name in turbineSchema.CHANNELS if name in turbineSchema.table_columns(con, table)]
+        os.makedirs(os.path.join(self.path, table), exist_ok=True)
+        self.invalidate(table)
+        names = [TIME_FILE] + channels
+        files = {name: open(self._file(table, name), 'wb') for name in names}
+        rows, last = 0, None
+        try:
+            sql = f'SELECT DateTime, {", ".join(channels)} FROM "{table}" ORDER BY DateTime'
+            for part in turbineQuery.iter_columns(con, sql, (), len(names)):
+                files[TIME_FILE].write((part[0] / 1000).astype(DTYPE).tobytes())
+                for i, name in enumerate(channels, 1):
+                    files[name].write(part[i].astype(DTYPE).tobytes())
+                rows += part.shape[1]
+                last = int(part[0, -1])
+        finally:
+            for f in files.values():
+                f.close()
+        self._write_meta(table, {'rows': rows, 'last': last, 'channels': channels})
+
+    def build(self, con, progress=None):
+        """Rebuild every managed turbine table; returns their names."""
+        tables = [table for table in turbineSchema.turbine_tables(con) if turbineSchema.is_managed(con, table)]
+        for table in tables:
+            if progress:
+                progress(f'Writing column files for {table}...')
+            self.rebuild(con, table)
+        return tables
@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+# Pragmas for every read connection
+READ_PRAGMAS = [
+    ('cache_size', -64000),
+    ('mmap_size', 256 * 2 ** 20),
+]
+# Prepared statements kept per connection; range queries repeat with new bounds
+STATEMENT_CACHE = 256
+
+
+class ConnectionManager:
+    """Long-lived connections to one database.
+
+    Each thread gets its own read connection, opened read-only when the file
+    already exists, and all writes share one writer connection in autocommit
+    mode (BulkWriter manages its own transactions). Under WAL the readers keep
+    working while an import is being written. Nothing is opened until it is
+    first needed; close() closes everything, and the manager cannot be used
+    after that.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._readers = []
+        self._writer = None
+        self._closed = False
+
+    def _check(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError(f'Connections to {self.path} are closed')
+
+    def _connect(self, read_only):
+        if read_only and os.path.exists(self.path):
+            # Path.as_uri, а не urllib.request.pathname2url: urllib.request грузится заметно дольше
+            uri = f'{Path(os.path.abspath(self.path)).as_uri()}?mode=ro'
+            con = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        else:
+            con = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE,
+                                  isolation_level=None)
+        for name, value in READ_PRAGMAS:
+            con.execute(f'PRAGMA {name} = {value}')
+        return con
+
+    def reader(self):
+        """The calling thread's read connection."""
+        self._check()
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            if not os.path.exists(self.path):
+                raise sqlite3.OperationalError(f'Database {self.path} does not exist yet')
+            con = self._local.con = self._connect(read_only=True)
+            with self._lock:
+                self._readers.append(con)
+        return con
+
+    def writer(self):
+        """The shared write connection (autocommit; use BEGIN/COMMIT explicitly)."""
+        self._check()
+        with self._lock:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+            return self._writer
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for con in self._readers + [self._writer]:
+                if con is not None:
+                    con.close()
+            self._readers = []
+            self._writer = None
+        self._local = threading.local()
@@ -0,0 +1,47 @@
+import numpy as np
+
+# Points kept per horizontal screen pixel (a min and a max)
+POINTS_PER_PIXEL = 2
+
+
+def minmax(x, y, buckets):
+    """Reduce a series to the min and max of each of `buckets` equal-count slices.
+
+    Spikes survive because every bucket keeps its extremes, in their original
+    order. The first and last samples are always kept. x must be sorted;
+    NaNs in y are ignored unless a whole bucket is NaN.
+    """
+    n = len(y)
+    if buckets <= 0 or n <= 2 * buckets:
+        return x, y
+    size = -(-n // buckets)
+    full = n // size
+    block = y[:full * size].reshape(full, size)
+    if np.isnan(block).any():
+        lo = np.where(np.isnan(block), np.inf, block).argmin(axis=1)
+        hi = np.where(np.isnan(block), -np.inf, block).argmax(axis=1)
+    else:
+        lo = block.argmin(axis=1)
+        hi = block.argmax(axis=1)
+    offset = np.arange(full) * size
+    first = offset + np.minimum(lo, hi)
+    second = offset + np.maximum(lo, hi)
+    index = np.empty(2 * full + 2, dtype=np.intp)
+    index[0] = 0
+    index[1:-1:2] = first
+    index[2:-1:2] = second
+    index[-1] = n - 1
+    if full * size < n:
+        tail = y[full * size:]
+        if not np.isnan(tail).all():
+            extra = full * size + np.unique([np.nanargmin(tail), np.nanargmax(tail)])
+            index = np.concatenate([index[:-1], extra, index[-1:]])
+    index = index[np.concatenate([[True], np.diff(index) != 0])]
+    return x[index], y[index]
+
+
+def visible(x, low, high):
+    """Slice bounds of sorted x covering [low, high], one sample beyond each edge."""
+    start = max(int(np.searchsorted(x, low, side='left')) - 1, 0)
+    stop = min(int(np.searchsorted(x, high, side='right')) + 1, len(x))
+    return start, stop
@@ -1,31 +1,76 @@
+import os
 import sqlite3
-from datetime import datetime
-
-from sqlalchemy import create_engine
 import sys
+import threading
+import time
+
+PROFILE_STARTUP = '--profile-startup' in sys.argv
+# python main.py --trace-log timings.jsonl: каждое действие дописывается в файл строкой JSON
+TRACE_LOG = sys.argv[sys.argv.index('--trace-log') + 1] if '--trace-log' in sys.argv[:-1] else None
+if PROFILE_STARTUP:
+    # До остальных импортов, иначе их время не попадёт в отчёт
+    import startupProfile
+    startupProfile.install()
 
 from PyQt5.QtGui import QIcon, QColor
 
 import qrc_resources
 
-import pandas as pd
-import pyqtgraph as pg
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QApplication, QLabel, QMainWindow, QMenu, QToolBar, QAction, QMessageBox, QFileDialog, \
     QTextEdit, QStatusBar, QWidget, QGridLayout, QTabWidget, QVBoxLayout, QPushButton, \
-    QTableView, QSplitter, QHBoxLayout, QInputDialog, QDialog, QCheckBox, QComboBox, QColorDialog, QStyleFactory
+    QTableView, QSplitter, QHBoxLayout, QInputDialog, QDialog, QCheckBox, QComboBox, QColorDialog, QStyleFactory, \
+    QProgressBar, QLineEdit, QListWidget, QListWidgetItem, QTableWidget, QTableWidgetItem, QDialogButtonBox
+from columnStore import ColumnStore
+from connectionManager import ConnectionManager
+import downsample
+import perfTrace
+import resultExport
+import tableFilter
+import turbineQuery
+import turbineSchema
 from pandasModel import PandasModel
-from timeAxisItem import TimeAxisItem
+from queryWorker import QueryWorker
+from resultCache import ResultCache
+from perfTrace import span
+from sqlTableModel import SqlTableModel, read_page
+
+
+# Пауза после панорамирования/масштабирования перед подгрузкой данных, мс
+FETCH_DELAY = 200
+# Запас, подгружаемый слева и справа от видимого окна, в долях его ширины
+PLOT_MARGIN = 0.5
+# Минимум потоков для фоновых запросов: SQLite отпускает GIL, так что их может быть больше, чем ядер
+QUERY_THREADS = 4
+# Сколько ждать отрисовки графика, прежде чем закрыть замер действия без неё, мс
+PAINT_WAIT = 1000
+
+
+DEFAULT_DB = 'turbinist.db'
 
 
 class Window(QMainWindow):
     """Main Window."""
-    con = sqlite3.connect('turbinist.db')
+
+    # Файл и число записанных строк; испускается из потока пула во время экспорта
+    exportProgress = QtCore.pyqtSignal(str, int)
+    # Текст хода импорта; тоже испускается из потока пула
+    importProgress = QtCore.pyqtSignal(str)
 
     def __init__(self, parent=None):
         """Initializer."""
         super().__init__(parent)
+        self.db = ConnectionManager(DEFAULT_DB)
+        self.cache = ResultCache()
+        self.columns = ColumnStore.open(self.db.path)
+        self.timings = perfTrace.Recorder(TRACE_LOG)
+        # Замеры, которые закроются после ближайшей отрисовки графика
+        self.paintTraces = []
+        self.timingDialog = None
+        self.exportProgress.connect(self.showExportProgress)
+        self.importProgress.connect(lambda text: self.statusbar.showMessage(text, 0))
+        self.importStop = threading.Event()
         self._unit()
         self._createActions()
         self._connectedActions()
@@ -39,10 +84,36 @@ class Window(QMainWindow):
         hbox = QHBoxLayout(self.centralWidget)
 
         self.topleft = QTableView(self)
-        date_axis = TimeAxisItem(orientation='bottom')
-        self.topright = pg.PlotWidget(axisItems={'bottom': date_axis})
-        self.topright.resize(500, 0)
-        self.topright.setBackground('w')
+        # Сортировка по щелчку на заголовке и фильтр выполняются моделью, без QSortFilterProxyModel
+        header = self.topleft.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(-1, Qt.AscendingOrder)
+        header.sortIndicatorChanged.connect(self.arrangeResult)
+        self.filterEdit = QLineEdit(self)
+        self.filterEdit.setPlaceholderText('Filter, e.g. TurbineExitTemp > 600 and EngineSpeed < 90000')
+        self.filterEdit.setClearButtonEnabled(True)
+        self.filterEdit.returnPressed.connect(self.arrangeResult)
+        resultBox = QWidget(self)
+        resultLayout = QVBoxLayout(resultBox)
+        resultLayout.setContentsMargins(0, 0, 0, 0)
+        resultLayout.addWidget(self.filterEdit)
+        resultLayout.addWidget(self.topleft)
+        # Сам график создаётся в ensurePlot, после показа окна: pyqtgraph грузится долго
+        self.topright = None
+        # Графики таблиц в режиме "друг под другом"; ось X у всех связана с topright
+        self.plots = []
+        self.plotBox = QSplitter(Qt.Vertical)
+        self.series = []
+        self.workers = []
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(QUERY_THREADS, QtCore.QThread.idealThreadCount()))
+        # Потоки не завершаются по простою, чтобы их соединения с БД жили всё время работы
+        self.pool.setExpiryTimeout(-1)
+        self.fetchTimer = QtCore.QTimer(self)
+        self.fetchTimer.setSingleShot(True)
+        self.fetchTimer.setInterval(FETCH_DELAY)
+        self.fetchTimer.timeout.connect(self.fetchVisible)
         self.bottom = QTabWidget(self)
         self.bottom.setMaximumHeight(150)
 
@@ -56,12 +127,27 @@ class Window(QMainWindow):
         self.clearBtn = QPushButton('Clear')
         self.clearBtn.clicked.connect(self.console.clear)
         subtab1.layout.addWidget(self.console, 1, 0, 1, 8)
+        self.exportBtn = QPushButton('Export...')
+        self.exportBtn.clicked.connect(self.exportConsole)
+        subtab1.layout.addWidget(self.exportBtn, 2, 5)
         subtab1.layout.addWidget(self.submitBtn, 2, 6)
         subtab1.layout.addWidget(self.clearBtn, 2, 7)
         subtab1.setLayout(subtab1.layout)
+        diagTab = QWidget()
+        self.bottom.addTab(diagTab, 'Diagnostics')
+        diagTab.layout = QGridLayout(diagTab)
+        self.cacheLabel = QLabel()
+        self.clearCacheBtn = QPushButton('Clear cache')
+        self.clearCacheBtn.clicked.connect(self.clearCache)
+        self.timingsBtn = QPushButton('Timings...')
+        self.timingsBtn.clicked.connect(self.timing_dialog)
+        diagTab.layout.addWidget(self.cacheLabel, 0, 0, 1, 7)
+        diagTab.layout.addWidget(self.clearCacheBtn, 0, 7)
+        diagTab.layout.addWidget(self.timingsBtn, 1, 7)
+        self.bottom.currentChanged.connect(self.showCacheStats)
         splitter1 = QSplitter(Qt.Horizontal)
-        splitter1.addWidget(self.topleft)
-        splitter1.addWidget(self.topright)
+        splitter1.addWidget(resultBox)
+        splitter1.addWidget(self.plotBox)
 
         splitter2 = QSplitter(Qt.Vertical)
         splitter2.addWidget(splitter1)
@@ -81,6 +167,8 @@ class Window(QMainWindow):
         menuBar.addMenu(fileMenu)
         fileMenu.addAction(self.connectionAction)
         fileMenu.addAction(self.addAction)
+        fileMenu.addAction(self.addFolderAction)
+        fileMenu.addAction(self.columnsAction)
         fileMenu.addSeparator()
         fileMenu.addAction(self.exitAction)
 
@@ -91,10 +179,12 @@ class Window(QMainWindow):
         queryMenu = QMenu("&SQLQuery", self)
         menuBar.addMenu(queryMenu)
         queryMenu.addAction(self.newQueryAction)
+        queryMenu.addAction(self.planAction)
 
         setMenu = QMenu("&Settings", self)
         menuBar.addMenu(setMenu)
         setMenu.addAction(self.userStyleAction)
+        setMenu.addAction(self.timingsAction)
 
         helpMenu = QMenu("&Help", self)
         menuBar.addMenu(helpMenu)
@@ -128,13 +218,32 @@ class Window(QMainWindow):
         self.statusbar = QStatusBar()
         self.setStatusBar(self.statusbar)
         self.statusbar.showMessage("Ready", 0)
+        self.busyBar = QProgressBar()
+        self.busyBar.setRange(0, 0)
+        self.busyBar.setMaximumWidth(100)
+        self.busyLabel = QLabel()
+        self.cancelBtn = QPushButton('Cancel')
+        self.cancelBtn.clicked.connect(self.cancelQueries)
+        for widget in (self.busyLabel, self.busyBar, self.cancelBtn):
+            self.statusbar.addPermanentWidget(widget)
+            widget.hide()
+        # Итог последнего действия по этапам; подробности - в окне Timings
+        self.timingLabel = QLabel()
+        self.statusbar.addPermanentWidget(self.timingLabel)
+        self.busyTimer = QtCore.QTimer(self)
+        self.busyTimer.setInterval(100)
+        self.busyTimer.timeout.connect(self.showBusy)
 
     def _createActions(self):
         self.connectionAction = QAction("&Connect DB", self)
         self.addAction = QAction("&Add to DB", self)
+        self.addFolderAction = QAction("Add &folder to DB", self)
+        self.columnsAction = QAction("Build &column files for plots", self)
         self.newChartAction = QAction("&New Chart", self)
         self.userStyleAction = QAction("&Style Settings", self)
         self.newQueryAction = QAction("&New Query", self)
+        self.planAction = QAction("Check query &plans", self)
+        self.timingsAction = QAction("&Timings", self)
         self.helpContentAction = QAction("&Help", self)
         self.aboutAction = QAction("About", self)
         self.exitAction = QAction("&Exit", self)
@@ -159,84 +268,473 @@ class Window(QMainWindow):
 
         self.exitAction.triggered.connect(self.close)
         self.newQueryAction.triggered.connect(self.query_dialog)
+        self.planAction.triggered.connect(self.checkPlans)
         self.newChartAction.triggered.connect(self.dialog_plot)
         self.ChartTB.triggered.connect(self.dialog_plot)
         self.QueryTB.triggered.connect(self.query_dialog)
         self.AddTB.triggered.connect(self.addToSQL)
         self.connectionAction.triggered.connect(self.connectSQL)
         self.addAction.triggered.connect(self.addToSQL)
+        self.addFolderAction.triggered.connect(self.addFolderToSQL)
+        self.columnsAction.triggered.connect(self.buildColumns)
         self.userStyleAction.triggered.connect(self.style_dialog)
+        self.timingsAction.triggered.connect(self.timing_dialog)
 
     def connectSQL(self):
         fname = QFileDialog.getOpenFileName(self, 'Open file', '*.db')
-        self.con = sqlite3.connect(f'{fname[0]}')
-        cur = self.con.cursor()
-        self.engine = create_engine(f'sqlite:///{fname[0]}')
+        if not fname[0]:
+            return
+        self.cancelQueries()
+        self.pool.waitForDone()
+        self.db.close()
+        self.db = ConnectionManager(fname[0])
+        # Страницы прежнего результата читались бы уже из другой базы
+        self.topleft.setModel(None)
+        self.cache.invalidate()
+        self.columns = ColumnStore.open(self.db.path)
+        self.checkDatabase()
+
+    def checkDatabase(self):
+        """Offer to migrate the legacy tables of the open database, then prepare its rollups.
+
+        Range queries bind integer epoch ms, which never match a text DateTime,
+        so tables left unmigrated cannot be queried (see tableSelector).
+        """
+        if not os.path.exists(self.db.path):
+            return
+        legacy = turbineSchema.legacy_tables(self.db.writer())
+        if legacy:
+            reply = QMessageBox.question(self, 'Migrate database',
+                                         f"Tables {', '.join(legacy)} use the old text DateTime format "
+                                         "and cannot be queried until they are migrated.\n"
+                                         "Migrate them now? This may take a while for large tables.",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                self.db.close()
+                turbineSchema.migrate_database(self.db.path, progress=self.statusbar.showMessage)
+                self.db = ConnectionManager(self.db.path)
+            else:
+                self.statusbar.showMessage(f"Not migrated, so not queryable: {', '.join(legacy)}", 0)
+        con = self.db.writer()
+        con.execute('BEGIN')
+        turbineSchema.ensure_rollups(con)
+        con.execute('COMMIT')
 
     def addToSQL(self):
         fname = QFileDialog.getOpenFileName(self, 'Open file', '*.csv')
-        try:
-            df = pd.read_csv(fname[0], sep=',', header=6, encoding="cp1251", index_col=False)
-            df.rename(columns={
-                'Incident Record ': 'IncidentRecord',
-                'Engine Speed (rpm)': 'EngineSpeed',
-                'Main Gen Power (W)': 'MainGenPower',
-                'Turbine Exit Temp (°C)': 'TurbineExitTemp',
-                'Fuel Valve Command (%)': 'FuelValveCommand',
-                'Fuel Inlet Pres (kPa)': 'FuelInletPres',
-                'Bat SOC (%)': 'BatSOC',
-                'Sec Bat SOC (%)': 'SecBatSOC',
-                'Starts ': 'Starts',
-                'Hours ': 'Hours',
-                'Output Current Phase A (A)': 'OutCurA',
-                'Output Current Phase B (A)': 'OutCurB',
-                'Output Current Phase C (A)': 'OutCurC',
-                'Output Current Neutral (A)': 'OutCurN',
-            }, inplace=True)
-            df['DateTime'] = df.apply(lambda x: '%s %s' % (x['Control Date '], x['Control Time ']), axis=1)
-            df['DateTime'] = pd.to_datetime(df.DateTime, errors='coerce')
-            data_list = [
-                'DateTime',
-                'IncidentRecord',
-                'EngineSpeed',
-                'MainGenPower',
-                'TurbineExitTemp',
-                'FuelValveCommand',
-                'FuelInletPres',
-                'BatSOC',
-                'SecBatSOC',
-                'Starts',
-                'Hours',
-                'OutCurA',
-                'OutCurB',
-                'OutCurC',
-                'OutCurN'
-            ]
-            result_df = df[data_list]
-            # Удаляем дубликаты по столбцу DateTime и перезаписываем фрейм
-            result_df = result_df.drop_duplicates(subset=['DateTime'], keep='first')
-            result_df.to_csv('temp.csv', index=False)
-
-        except:
-            pass
-
+        if not fname[0]:
+            return
         data, ok = QInputDialog.getText(self, 'Table selection',
                                         'Enter table name:')
-        if ok:
-            result_df.to_sql(f'{data}', con=self.engine, if_exists='append', index=False)
+        if not ok:
+            return
+        path, table = fname[0], f'{data}'
+
+        def job(con):
+            import capstoneImport
+            return capstoneImport.import_csv(path, self.db.writer(), table, progress=self.importStep)
+
+        def done(report):
+            perfTrace.count('rows', report.stored)
+            self.statusbar.showMessage(str(report), 0)
+
+        self.runImport(job, done, table, table)
+
+    def addFolderToSQL(self):
+        folder = QFileDialog.getExistingDirectory(self, 'Open folder')
+        if not folder:
+            return
+        # pandas нужен только импорту, поэтому и грузится при первом импорте
+        import capstoneImport
+        paths = capstoneImport.expand_paths(folder)
+        if not paths:
+            QMessageBox.information(self, 'Import', f'No CSV files in {folder}')
+            return
+        data, ok = QInputDialog.getText(self, 'Table selection',
+                                        'Enter table name (empty - take it from file names):')
+        if not ok:
+            return
+        self.statusbar.showMessage(f'Importing {len(paths)} files...', 0)
+        table = data or None
+
+        def job(con):
+            return capstoneImport.import_batch(paths, self.db.writer(), table, progress=self.batchProgress)
+
+        def done(reports):
+            rows = sum(report.stored for report in reports)
+            failed = sum(report.error is not None for report in reports)
+            perfTrace.count('rows', rows)
+            perfTrace.count('files', len(reports))
+            if failed:
+                perfTrace.current().status = f'{failed} failed'
+            self.statusbar.showMessage(f'Imported {len(reports) - failed} files, {rows:,} rows stored'
+                                       + (f', {failed} failed' if failed else ''), 0)
+            QMessageBox.information(self, 'Import', '\n'.join(str(report) for report in reports))
+
+        self.runImport(job, done, data or folder, table)
+
+    def runImport(self, job, done, detail, table):
+        """Run an import job(con) on the query pool, writing through the shared writer connection.
+
+        Connect DB, the other imports and Build column files are disabled until
+        it is over, since they would close or share the connection being
+        written. table (None for all) is dropped from the plot cache however
+        the import ends: even a failed one may have written some rows.
+        """
+        # Писатель создаёт файл базы: без него поток пула не получит читающее соединение
+        self.db.writer()
+        trace = self.startTrace('Import', detail)
+        self.importStop.clear()
+        self.setImporting(True)
+
+        def finished(result):
+            self.setImporting(False)
+            self.cache.invalidate(table)
+            done(result)
+
+        def stopped(error):
+            self.setImporting(False)
+            self.cache.invalidate(table)
+
+        self.runQuery(job, finished, 'Import', trace, failed=stopped)
+        trace.release()
+
+    def setImporting(self, running):
+        for action in (self.connectionAction, self.addAction, self.AddTB, self.addFolderAction, self.columnsAction):
+            action.setEnabled(not running)
+
+    def importStep(self, report):
+        """Progress callback of an import, called on the pool thread after every chunk or file."""
+        if self.importStop.is_set():
+            # Исключение откатывает незакоммиченную часть, уже записанные пакеты остаются
+            raise InterruptedError('Import cancelled')
+        self.importProgress.emit(f'Importing {report.table}: {report.stored:,} rows stored '
+                                 f'({report.rows_per_second:,.0f} rows/s)')
+
+    def batchProgress(self, report):
+        print(report)
+        self.importStep(report)
+
+    def runQuery(self, job, done, label, trace=None, failed=None):
+        """Run job(con) on the thread pool and pass its result to done() on the GUI thread.
+
+        Both run with trace active (a new one named label if none is given);
+        the job holds the trace until done() has returned. failed, if given, is
+        called on the GUI thread as failed(True) when the job fails and as
+        failed(False) when it is cancelled.
+        """
+        if trace is None:
+            trace = self.startTrace(label)
+        else:
+            trace.hold()
+        submitted = time.perf_counter()
+
+        def traced(con):
+            trace.add('queue', time.perf_counter() - submitted)
+            with trace.active():
+                return job(con)
+
+        worker = QueryWorker(self.db, traced)
+        worker.label = label
+        worker.trace = trace
+        worker.started = time.perf_counter()
+        worker.signals.finished.connect(lambda result: self.queryFinished(worker, done, result))
+        worker.signals.failed.connect(lambda message: self.queryFailed(worker, message))
+        worker.signals.cancelled.connect(lambda: self.queryCancelled(worker))
+        if failed is not None:
+            worker.signals.failed.connect(lambda message: failed(True))
+            worker.signals.cancelled.connect(lambda: failed(False))
+        self.workers.append(worker)
+        self.pool.start(worker)
+        self.showBusy()
+        self.busyTimer.start()
+        for widget in (self.busyLabel, self.busyBar, self.cancelBtn):
+            widget.show()
+        return worker
+
+    def readPage(self, job, done, failed):
+        """Read a follow-on page of the result table on the pool (see SqlTableModel)."""
+        self.runQuery(job, done, 'Fetch rows', failed=failed)
+
+    def showBusy(self):
+        if self.workers:
+            now = time.perf_counter()
+            self.busyLabel.setText(', '.join(f'{worker.label} {now - worker.started:.1f} s' for worker in self.workers))
+
+    def queryDone(self, worker):
+        self.workers.remove(worker)
+        if not self.workers:
+            self.busyTimer.stop()
+            for widget in (self.busyLabel, self.busyBar, self.cancelBtn):
+                widget.hide()
+        self.statusbar.showMessage(f'{worker.label}: {time.perf_counter() - worker.started:.2f} s', 0)
+        self.showCacheStats()
+
+    def showCacheStats(self):
+        stats = self.cache.stats()
+        lookups = stats['hits'] + stats['subrange_hits'] + stats['misses']
+        rate = (stats['hits'] + stats['subrange_hits']) / lookups if lookups else 0
+        self.cacheLabel.setText(
+            f"Plot data cache: {stats['entries']} windows, {stats['bytes'] / 2 ** 20:.1f} of "
+            f"{stats['budget'] / 2 ** 20:.0f} MB\n"
+            f"{stats['hits']} hits, {stats['subrange_hits']} served from a wider window, "
+            f"{stats['misses']} misses ({rate:.0%} hit rate), {stats['evictions']} evicted")
+
+    def clearCache(self):
+        self.cache.invalidate()
+        self.showCacheStats()
+
+    def queryFinished(self, worker, done, result):
+        self.queryDone(worker)
+        try:
+            with worker.trace.active():
+                done(result)
+        finally:
+            worker.trace.release()
+
+    def queryFailed(self, worker, message):
+        self.queryDone(worker)
+        worker.trace.status = 'failed'
+        worker.trace.release()
+        self.statusbar.showMessage(f'{worker.label} failed', 0)
+        QMessageBox.critical(self, 'Query error', message)
+
+    def queryCancelled(self, worker):
+        self.queryDone(worker)
+        worker.trace.status = 'cancelled'
+        worker.trace.release()
+        self.statusbar.showMessage(f'{worker.label} cancelled', 0)
+
+    def startTrace(self, action, detail=''):
+        """Trace of one user action; release() it once its jobs have been started."""
+        return perfTrace.Trace(action, detail, self.traceFinished)
+
+    def traceFinished(self, trace):
+        if trace.status == 'unused':
+            return
+        self.timings.record(trace)
+        self.timingLabel.setText(trace.summary())
+        if self.timingDialog is not None and self.timingDialog.isVisible():
+            self.showTimings()
+
+    def awaitPaint(self):
+        """Keep the active trace open until the plot has been painted (or PAINT_WAIT has passed)."""
+        trace = perfTrace.current()
+        if trace is None or any(trace is waiting for waiting in self.paintTraces):
+            return
+        trace.hold()
+        self.paintTraces.append(trace)
+        QtCore.QTimer.singleShot(PAINT_WAIT, self.releasePaint)
+
+    def releasePaint(self, seconds=None):
+        traces, self.paintTraces = self.paintTraces, []
+        for trace in traces:
+            if seconds is not None:
+                trace.add('paint', seconds)
+            trace.release()
+
+    def cancelQueries(self):
+        self.importStop.set()
+        for worker in self.workers:
+            worker.cancel()
 
     def submitQuery(self):
         text = self.console.toPlainText()
         sql = f"""{text}"""
-        con = sqlite3.connect('turbinist.db')
-        result_df = pd.read_sql(sql, con)
-        model = PandasModel(result_df)
-        self.topleft.setModel(model)
+
+        def job(con):
+            return read_page(con, sql)
+
+        # Первая страница читается в фоне, остальные - по мере прокрутки таблицы
+        self.runQuery(job, lambda first: self.showResult(SqlTableModel(self.db, sql, first, submit=self.readPage)),
+                      'SQL query')
+
+    def exportConsole(self):
+        sql = self.console.toPlainText().strip().rstrip(';')
+        if not sql:
+            return
+        try:
+            # LIMIT 0 только готовит запрос - так узнаём столбцы, не выполняя его
+            cur = self.db.reader().execute(f'SELECT * FROM ({sql}) LIMIT 0')
+            names = [column[0] for column in cur.description]
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, 'Export', f'Only a SELECT can be exported: {e}')
+            return
+        choice = self.export_dialog(names, 'DateTime' in names)
+        if choice is None:
+            return
+        columns, window, _, path = choice
+        select = ', '.join('"{}"'.format(name.replace('"', '""')) for name in columns)
+        query = f'SELECT {select} FROM ({sql})'
+        if window is not None:
+            query += ' WHERE DateTime BETWEEN ? AND ?'
+        self.runExport([(query, window or (), path)])
+
+    def exportQuery(self):
+        tables = self.selectedTables() or [self.tableList.item(0).text()]
+        channels = [key for key in self.langs.keys() if self.langs[key] == 1]
+        window = turbineQuery.range_params(self.dateEditS.dateTime().toString('yyyy-MM-dd hh:mm:ss'),
+                                           self.dateEditF.dateTime().toString('yyyy-MM-dd hh:mm:ss'))
+        choice = self.export_dialog(list(turbineSchema.CHANNELS), True, channels or None, window, levels=True)
+        if choice is None:
+            return
+        columns, window, level, path = choice
+        columns = [name for name in columns if name != 'DateTime']
+        if not columns:
+            return
+        exports = []
+        for table in tables:
+            # Несколько таблиц - по файлу на каждую: MT125.csv -> export_MT125.csv
+            root, ext = os.path.splitext(path)
+            target = path if len(tables) == 1 else f'{root}_{table}{ext}'
+            exports.append((turbineQuery.range_sql(table, columns, level), window or (-2 ** 63, 2 ** 63 - 1), target))
+        self.runExport(exports)
+
+    def export_dialog(self, names, timed, checked=None, window=None, levels=False):
+        """Ask for the columns, the time window, the level and the file of an export.
+
+        Returns (columns, (start_ms, finish_ms) or None, level or None, path),
+        or None if the user cancels.
+        """
+        dialog = QDialog(self)
+        grid = QGridLayout(dialog)
+        columnList = QListWidget(dialog)
+        for name in names:
+            item = QListWidgetItem(name, columnList)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if checked is None or name in checked else Qt.Unchecked)
+        windowBox = QCheckBox('Only rows from', dialog)
+        startEdit = QtWidgets.QDateTimeEdit(dialog)
+        finishEdit = QtWidgets.QDateTimeEdit(dialog)
+        for edit, value in zip((startEdit, finishEdit), window or (None, None)):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat('yyyy-MM-dd hh:mm:ss')
+            edit.setTimeSpec(Qt.UTC)
+            if value is not None:
+                edit.setDateTime(QtCore.QDateTime.fromMSecsSinceEpoch(value, Qt.UTC))
+        windowBox.setChecked(window is not None)
+        windowBox.setEnabled(timed)
+        levelBox = QComboBox(dialog)
+        levelBox.addItem('Raw rows', None)
+        for level, _ in turbineSchema.ROLLUPS:
+            levelBox.addItem(f'{level} rollup (mean, min, max)', level)
+        levelBox.setVisible(levels)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        grid.addWidget(QLabel('Columns:'), 0, 0)
+        grid.addWidget(columnList, 1, 0, 1, 4)
+        grid.addWidget(windowBox, 2, 0)
+        grid.addWidget(startEdit, 2, 1)
+        grid.addWidget(QLabel('to'), 2, 2)
+        grid.addWidget(finishEdit, 2, 3)
+        grid.addWidget(levelBox, 3, 0, 1, 4)
+        grid.addWidget(buttons, 4, 0, 1, 4)
+        dialog.setWindowTitle('Export')
+        if dialog.exec_() != QDialog.Accepted:
+            return None
+        columns = [columnList.item(i).text() for i in range(columnList.count())
+                   if columnList.item(i).checkState() == Qt.Checked]
+        if not columns:
+            return None
+        path, kind = QFileDialog.getSaveFileName(self, 'Export', 'export.csv', 'CSV (*.csv);;Parquet (*.parquet)')
+        if not path:
+            return None
+        if not os.path.splitext(path)[1]:
+            path += '.parquet' if 'parquet' in kind else '.csv'
+        window = None
+        if windowBox.isChecked() and timed:
+            window = startEdit.dateTime().toMSecsSinceEpoch(), finishEdit.dateTime().toMSecsSinceEpoch()
+        return columns, window, levelBox.currentData(), path
+
+    def runExport(self, exports):
+        """Write each (sql, params, path) of exports in turn on the query pool."""
+        paths = [path for _, _, path in exports]
+        trace = self.startTrace('Export', ', '.join(os.path.basename(path) for path in paths))
+
+        def job(con):
+            rows = []
+            for sql, params, path in exports:
+                name = os.path.basename(path)
+                with span('SQL'):
+                    cur = con.execute(sql, params)
+                rows.append(resultExport.export(cur, path,
+                                                progress=lambda count: self.exportProgress.emit(name, count)))
+            return rows
+
+        def done(rows):
+            perfTrace.count('rows', sum(rows))
+            self.statusbar.showMessage(f'Exported {sum(rows):,} rows to {", ".join(paths)}', 0)
+
+        self.runQuery(job, done, 'Export', trace)
+        trace.release()
+
+    def showExportProgress(self, name, rows):
+        self.statusbar.showMessage(f'Exporting {name}: {rows:,} rows written', 0)
+
+    def showResult(self, model):
+        header = self.topleft.horizontalHeader()
+        header.blockSignals(True)
+        header.setSortIndicator(-1, Qt.AscendingOrder)
+        header.blockSignals(False)
+        self.filterEdit.clear()
+        with span('render'):
+            self.topleft.setModel(model)
+
+    def arrangeResult(self):
+        """Apply the header sort and the filter line to the result table."""
+        model = self.topleft.model()
+        if model is None:
+            return
+        header = self.topleft.horizontalHeader()
+        section = header.sortIndicatorSection()
+        columns = [model.headerData(i, Qt.Horizontal, Qt.DisplayRole) for i in range(model.columnCount())]
+        order = None
+        if 0 <= section < len(columns):
+            order = columns[section], header.sortIndicatorOrder() == Qt.DescendingOrder
+        try:
+            conditions = tableFilter.parse(self.filterEdit.text(), columns)
+            if isinstance(model, SqlTableModel):
+                plan = model.plan(order, conditions)
+                # Первая страница после сортировки может потребовать полного прохода - читаем её в фоне
+                self.runQuery(lambda con: read_page(con, plan[0], plan[1]),
+                              lambda first: model.arrange(plan, first), 'Sort/filter')
+            else:
+                trace = self.startTrace('Sort/filter')
+                with trace.active(), span('sort'):
+                    model.arrange(order, conditions)
+                trace.release()
+        except ValueError as e:
+            self.statusbar.showMessage(f'Filter: {e}', 0)
+
+    def buildColumns(self):
+        # Файлы пишутся из читающего соединения пула; дальше их дополняет каждый импорт
+        store = ColumnStore.create(self.db.path)
+
+        def done(tables):
+            self.columns = store
+            self.statusbar.showMessage(self.statusbar.currentMessage()
+                                       + f' - column files for {", ".join(tables) or "no tables"}', 0)
+
+        self.runQuery(store.build, done, 'Column files')
+
+    def checkPlans(self):
+        plans = turbineQuery.check_plans(self.db.reader())
+        lines = []
+        for table, (plan, warnings) in plans.items():
+            lines.append(f'{table}: ' + ('WARNING - ' + '; '.join(warnings) if warnings else 'OK'))
+            lines.extend(f'    {detail}' for detail in plan)
+        if not lines:
+            lines.append(f'No turbine tables in {self.db.path}')
+        if any(warnings for _, warnings in plans.values()):
+            QMessageBox.warning(self, 'Query plans', '\n'.join(lines))
+        else:
+            QMessageBox.information(self, 'Query plans', '\n'.join(lines))
 
     def query_dialog(self):
         self.dialog = QDialog()
         grid = QGridLayout()
-        self.combo = QComboBox()
+        self.tableList = self.tableSelector()
         self.langs = {
             'IncidentRecord': 0,
             'EngineSpeed': 0,
@@ -304,10 +802,11 @@ class Window(QMainWindow):
         grid.addWidget(cbOutCurB, 3, 3)
         grid.addWidget(cbOutCurC, 4, 0)
         grid.addWidget(cbOutCurN, 4, 1)
-        grid.addWidget(self.combo, 4, 2)
-        self.combo.addItems(["MT125", "MT127",
-                             "MT129"])
+        grid.addWidget(self.tableList, 4, 2)
         grid.addWidget(submitBtn, 4, 3)
+        exportBtn = QPushButton('Export...', self.dialog)
+        exportBtn.clicked.connect(self.exportQuery)
+        grid.addWidget(exportBtn, 7, 3)
         grid.addWidget(lblStart, 5, 0)
         grid.addWidget(self.dateEditS, 6, 0, 1, 2)
         grid.addWidget(lblFinish, 5, 2)
@@ -326,7 +825,7 @@ class Window(QMainWindow):
         self.col = QColor(0, 0, 0)
         self.dialog = QDialog()
         grid = QGridLayout()
-        self.combo = QComboBox()
+        self.tableList = self.tableSelector()
         self.langs = {
             'IncidentRecord': 0,
             'EngineSpeed': 0,
@@ -397,10 +896,10 @@ class Window(QMainWindow):
         grid.addWidget(cbOutCurB, 3, 3)
         grid.addWidget(cbOutCurC, 4, 0)
         grid.addWidget(cbOutCurN, 4, 1)
-        grid.addWidget(self.combo, 4, 2)
+        grid.addWidget(self.tableList, 4, 2)
         grid.addWidget(self.colBtn, 4, 3)
-        self.combo.addItems(["MT125", "MT127",
-                             "MT129"])
+        self.stackBox = QCheckBox('One plot per table', self.dialog)
+        grid.addWidget(self.stackBox, 8, 0, 1, 2)
         grid.addWidget(clearBtn, 5, 0, 1, 2)
         grid.addWidget(submitBtn, 5, 2, 1, 2)
 
@@ -411,7 +910,7 @@ class Window(QMainWindow):
         self.colBtn.setStyleSheet("QPushButton {background-color: %s }"
                                   % self.col.name())
         submitBtn.clicked.connect(self.draw_plot)
-        clearBtn.clicked.connect(self.topright.clear)
+        clearBtn.clicked.connect(self.clearPlot)
         self.colBtn.clicked.connect(self.setPlotColor)
         self.dateEditS.dateTimeChanged.connect(self.onDateChangedStart)
         self.dateEditF.dateTimeChanged.connect(self.onDateChangedFinish)
@@ -421,6 +920,35 @@ class Window(QMainWindow):
         self.dialog.setGeometry(300, 300, 0, 0)
         self.dialog.show()
 
+    def tableSelector(self):
+        """Checkable list of turbine tables for the plot and query dialogs; the first is checked."""
+        tables = ["MT125", "MT127", "MT129"]
+        legacy = []
+        try:
+            con = self.db.reader()
+            tables += [table for table in turbineSchema.turbine_tables(con) if table not in tables]
+            legacy = turbineSchema.legacy_tables(con)
+        except sqlite3.OperationalError:
+            # Базы ещё нет - показываем только стандартные таблицы
+            pass
+        # Таблицы с текстовым DateTime не ищутся по диапазону: показываем их последними и неактивными
+        tables.sort(key=lambda table: table in legacy)
+        tableList = QListWidget(self.dialog)
+        for i, table in enumerate(tables):
+            item = QListWidgetItem(table, tableList)
+            if table in legacy:
+                item.setFlags(item.flags() & ~(Qt.ItemIsEnabled | Qt.ItemIsUserCheckable))
+                item.setToolTip('Old text DateTime format: migrate the database (Connect DB) to query it')
+                continue
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if i == 0 else Qt.Unchecked)
+        tableList.setMaximumHeight(80)
+        return tableList
+
+    def selectedTables(self):
+        return [self.tableList.item(i).text() for i in range(self.tableList.count())
+                if self.tableList.item(i).checkState() == Qt.Checked]
+
     def style_dialog(self):
         dialog = QDialog()
         dialog_hbox = QHBoxLayout()
@@ -440,6 +968,78 @@ class Window(QMainWindow):
         dialog.setWindowModality(Qt.ApplicationModal)
         dialog.exec_()
 
+    def timing_dialog(self):
+        if self.timingDialog is None:
+            self.timingDialog = QDialog(self)
+            layout = QVBoxLayout(self.timingDialog)
+            tabs = QTabWidget(self.timingDialog)
+            self.historyTable = QTableWidget(0, 6, self.timingDialog)
+            self.historyTable.setHorizontalHeaderLabels(['Time', 'Action', 'Detail', 'Total, ms', 'Stages', 'Counts'])
+            self.percentileTable = QTableWidget(0, 6, self.timingDialog)
+            self.percentileTable.setHorizontalHeaderLabels(['Action', 'Stage', 'Runs', 'p50, ms', 'p90, ms',
+                                                            'p99, ms'])
+            for table in (self.historyTable, self.percentileTable):
+                table.setEditTriggers(QTableWidget.NoEditTriggers)
+                table.horizontalHeader().setStretchLastSection(True)
+            tabs.addTab(self.historyTable, 'History')
+            tabs.addTab(self.percentileTable, 'Percentiles')
+            self.traceLogLabel = QLabel(self.timingDialog)
+            self.traceLogBtn = QPushButton(self.timingDialog)
+            self.traceLogBtn.clicked.connect(self.toggleTraceLog)
+            clearBtn = QPushButton('Clear history', self.timingDialog)
+            clearBtn.clicked.connect(self.clearTimings)
+            buttons = QHBoxLayout()
+            buttons.addWidget(self.traceLogLabel, 1)
+            buttons.addWidget(self.traceLogBtn)
+            buttons.addWidget(clearBtn)
+            layout.addWidget(tabs)
+            layout.addLayout(buttons)
+            self.timingDialog.setWindowTitle('Timings')
+            self.timingDialog.setWindowModality(Qt.NonModal)
+            self.timingDialog.resize(800, 400)
+        self.showTimings()
+        self.timingDialog.show()
+        self.timingDialog.raise_()
+
+    def showTimings(self):
+        history = list(reversed(self.timings.history))
+        self.historyTable.setRowCount(len(history))
+        for row, record in enumerate(history):
+            stages = ', '.join(f'{stage} {ms:.0f}' for stage, ms in record['stages_ms'].items())
+            counts = ', '.join(f'{name} {value:,}' for name, value in record['counts'].items())
+            status = '' if record['status'] == 'ok' else f" ({record['status']})"
+            for column, text in enumerate([record['time'], record['action'] + status, record['detail'],
+                                           f"{record['total_ms']:.0f}", stages, counts]):
+                self.historyTable.setItem(row, column, QTableWidgetItem(text))
+        rows = [(action, stage) + values for action, stages in self.timings.percentiles().items()
+                for stage, values in stages.items()]
+        self.percentileTable.setRowCount(len(rows))
+        for row, (action, stage, runs, *percentiles) in enumerate(rows):
+            for column, text in enumerate([action, stage, str(runs)] + [f'{ms:.1f}' for ms in percentiles]):
+                self.percentileTable.setItem(row, column, QTableWidgetItem(text))
+        self.historyTable.resizeColumnsToContents()
+        self.percentileTable.resizeColumnsToContents()
+        path = self.timings.log_path
+        self.traceLogLabel.setText(f'Trace log: {path}' if path else 'Trace log: off')
+        self.traceLogBtn.setText('Stop trace log' if path else 'Write trace log...')
+
+    def toggleTraceLog(self):
+        if self.timings.log_path:
+            self.timings.close_log()
+        else:
+            fname = QFileDialog.getSaveFileName(self, 'Trace log', 'turbinist-trace.jsonl', '*.jsonl')
+            if not fname[0]:
+                return
+            try:
+                self.timings.open_log(fname[0])
+            except OSError as e:
+                QMessageBox.critical(self, 'Trace log', str(e))
+        self.showTimings()
+
+    def clearTimings(self):
+        self.timings.clear()
+        self.showTimings()
+
     def changeStyle(self, styleName):
         QApplication.setStyle(QStyleFactory.create(styleName))
 
@@ -540,42 +1140,205 @@ class Window(QMainWindow):
                                       % self.col.name())
 
     def draw_query(self):
-        checkedlangs = ', '.join([key for key in self.langs.keys()
-
-                                  if self.langs[key] == 1])
-
-        curr_text = self.combo.currentText()
-        sql = f"""SELECT DateTime, {checkedlangs}  FROM {curr_text} WHERE DateTime 
-              BETWEEN '{self.resS}' AND '{self.resF}' ORDER BY DateTime"""
-        con = sqlite3.connect('turbinist.db')
-        result_df = pd.read_sql(sql, con)
-        model = PandasModel(result_df)
-        self.topleft.setModel(model)
+        checkedlangs = [key for key in self.langs.keys()
+
+                        if self.langs[key] == 1]
+
+        tables = self.selectedTables()
+        start, finish = turbineQuery.range_params(self.resS, self.resF)
+        if len(tables) > 1:
+            self.queryTables(tables, checkedlangs, start, finish)
+            return
+        curr_text = tables[0] if tables else self.tableList.item(0).text()
+        trace = self.startTrace('Query', curr_text)
+
+        def job(con):
+            level = turbineQuery.pick_level(con, curr_text, start, finish, turbineQuery.QUERY_POINTS)
+            sql = turbineQuery.range_sql(curr_text, checkedlangs, level)
+            count = turbineQuery.count_range(con, curr_text, start, finish, level)
+            return sql, read_page(con, sql, (start, finish)), count, level
+
+        def done(result):
+            sql, first, count, level = result
+            perfTrace.count('rows', count)
+            self.showResult(SqlTableModel(self.db, sql, first, (start, finish), self.readPage))
+            self.statusbar.showMessage(self.statusbar.currentMessage() + f' - {curr_text}: {count:,} rows'
+                                       + (f' ({level} rollup: mean, min, max)' if level else ''), 0)
+
+        self.runQuery(job, done, f'Query {curr_text}', trace)
+        trace.release()
+
+    def queryTables(self, tables, columns, start, finish):
+        # Таблицы читаются параллельно, каждая на своём соединении пула; сводим их, когда готовы все
+        reads = {}
+        trace = self.startTrace('Query', ', '.join(tables))
+
+        def collect(table, read):
+            reads[table] = read
+            if len(reads) == len(tables):
+                frame = turbineQuery.align({table: reads[table] for table in tables}, start, finish)
+                perfTrace.count('rows', len(frame))
+                self.showResult(PandasModel(frame))
+                self.statusbar.showMessage(self.statusbar.currentMessage()
+                                           + f' - {", ".join(tables)}: {len(frame):,} rows side by side', 0)
+
+        for table in tables:
+            self.runQuery(lambda con, table=table: turbineQuery.read_columns(con, table, columns, start, finish),
+                          lambda read, table=table: collect(table, read), f'Query {table}', trace)
+        trace.release()
 
     def draw_plot(self):
-        checkedlangs = ', '.join([key for key in self.langs.keys()
-
-                                  if self.langs[key] == 1])
-
-        curr_text = self.combo.currentText()
-        sql = f"""SELECT DateTime,{checkedlangs} FROM {curr_text} WHERE DateTime 
-              BETWEEN '{self.resS}' AND '{self.resF}' ORDER BY DateTime"""
-        con = sqlite3.connect('turbinist.db')
-        df = pd.read_sql(sql, con)
-        res = df.columns.values.tolist()
-        list_x = []
-        for i in df.DateTime:
-            list_x.append(datetime.strptime(i, '%Y-%m-%d %H:%M:%S.%f'))
-        for i in range(1, len(res)):
-            list_y = df[res[i]].to_list()
-            self.topright.addLegend()
-            self.topright.plot(x=[x.timestamp() for x in list_x], y=list_y, name=f'{res[i]} {curr_text}',
-                               pen=f'{self.col.name()}')
+        checkedlangs = [key for key in self.langs.keys()
+
+                        if self.langs[key] == 1]
+
+        self.ensurePlot()
+        tables = self.selectedTables() or [self.tableList.item(0).text()]
+        start, finish = turbineQuery.range_params(self.resS, self.resF)
+        buckets = self.plotBuckets()
+        stack = self.stackBox.isChecked()
+        trace = self.startTrace('Plot', ', '.join(tables))
+        for i, table in enumerate(tables):
+            # Наложенные таблицы различаем цветом, у первой - выбранный цвет
+            pen = self.col.name() if i == 0 or stack else QColor.fromHsv(360 * i // len(tables), 255, 200)
+            self.plotTable(self.plotFor(i if stack else 0), table, checkedlangs, start, finish, buckets, pen, trace)
+        trace.release()
+
+    def plotTable(self, plot, table, channels, start, finish, buckets, pen, trace):
+        source = turbineQuery.SeriesWindow(table, channels, self.cache, self.columns)
+
+        def done(window):
+            source.apply(window)
+            perfTrace.count('pts', len(source.x))
+            curves = {}
+            plot.addLegend()
+            for name in channels:
+                curves[name] = plot.plot(name=f'{name} {table}', pen=pen)
+            self.series.append((source, curves))
+            # Ось X задаём сами: автомасштаб по X раздувал бы окно на запас, загруженный про запас
+            plot.enableAutoRange(axis='y')
+            plot.setAutoVisible(y=True)
+            self.topright.setXRange(start / 1000, finish / 1000, padding=0)
+            self.refreshPlot()
+            self.showPlotStatus()
+
+        self.runQuery(lambda con: source.fetch(con, start, finish, buckets), done, f'Plot {table}', trace)
+
+    def plotFor(self, index):
+        """index-th plot of the stack, created on demand with its x-axis linked to the first."""
+        while len(self.plots) <= index:
+            plot = self.newPlot()
+            plot.setXLink(self.topright)
+            self.plotBox.addWidget(plot)
+            self.plots.append(plot)
+        return self.plots[index]
+
+    def ensurePlot(self):
+        """Create the main plot on first use (or right after the window is shown)."""
+        if self.topright is not None:
+            return
+        self.topright = self.newPlot()
+        self.topright.resize(500, 0)
+        self.topright.sigXRangeChanged.connect(self.refreshPlot)
+        self.plots = [self.topright]
+        self.plotBox.addWidget(self.topright)
+
+    def newPlot(self):
+        import pyqtgraph as pg
+        from timeAxisItem import TimeAxisItem
+        plot = pg.PlotWidget(axisItems={'bottom': TimeAxisItem(orientation='bottom')})
+        plot.setBackground('w')
+        paintEvent = plot.paintEvent
+
+        def timedPaint(event):
+            # Время отрисовки засчитываем действиям, которые её вызвали (см. awaitPaint)
+            began = time.perf_counter()
+            paintEvent(event)
+            if self.paintTraces:
+                self.releasePaint(time.perf_counter() - began)
+
+        plot.paintEvent = timedPaint
+        return plot
+
+    def plotBuckets(self):
+        return max(int(self.topright.getViewBox().width()), 100) * downsample.POINTS_PER_PIXEL // 2
+
+    def refreshPlot(self):
+        # Сразу перерисовываем то, что уже загружено (грубо), а точные данные
+        # для нового окна подгружаем после паузы в панорамировании/масштабировании
+        self.renderPlot()
+        self.fetchTimer.start()
+
+    def renderPlot(self):
+        # Каждую серию прореживаем до ~2 точек на пиксель в видимом окне (min/max)
+        (low, high), _ = self.topright.viewRange()
+        buckets = self.plotBuckets()
+        for source, curves in self.series:
+            start, stop = downsample.visible(source.x, low, high)
+            for name, curve in curves.items():
+                with span('decimate'):
+                    x, y = downsample.minmax(source.x[start:stop], source.ys[name][start:stop], buckets)
+                with span('render'):
+                    curve.setData(x, y)
+        self.awaitPaint()
+
+    def fetchVisible(self):
+        if not self.series or self.topright.getViewBox().autoRangeEnabled()[0]:
+            return
+        (low, high), _ = self.topright.viewRange()
+        start, finish = int(low * 1000), int(high * 1000)
+        margin = (finish - start) * PLOT_MARGIN
+        buckets = self.plotBuckets()
+        for source, curves in self.series:
+            self.fetchWindow(source, start, finish, margin, buckets)
+
+    def fetchWindow(self, source, start, finish, margin, buckets):
+        # Применяем только ответ на последний запрос этой серии: более ранние могли устареть
+        source.request = getattr(source, 'request', 0) + 1
+        request = source.request
+        trace = self.startTrace('Load', source.table)
+
+        def job(con):
+            if source.covers(con, start, finish, buckets):
+                return None
+            return source.fetch(con, int(start - margin), int(finish + margin), int(buckets * (1 + 2 * PLOT_MARGIN)))
+
+        def done(window):
+            if window is None:
+                # Окно уже загружено - замер не нужен
+                trace.status = 'unused'
+            elif request == source.request and any(source is s for s, _ in self.series):
+                source.apply(window)
+                perfTrace.count('pts', len(source.x))
+                self.renderPlot()
+                self.showPlotStatus()
+            else:
+                trace.status = 'stale'
+
+        self.runQuery(job, done, f'Load {source.table}', trace)
+        trace.release()
+
+    def showPlotStatus(self):
+        self.statusbar.showMessage('; '.join(
+            f'{source.table}: {len(source.x):,} points' + (f' from {source.level} rollup' if source.level else '')
+            for source, _ in self.series), 0)
+
+    def clearPlot(self):
+        self.ensurePlot()
+        self.topright.clear()
+        for plot in self.plots[1:]:
+            plot.setParent(None)
+            plot.deleteLater()
+        self.plots = [self.topright]
+        self.series = []
 
     def closeEvent(self, event):
         reply = QMessageBox.question(self, 'Message', "Are you sure to quit?", QMessageBox.Yes | QMessageBox.No,
                                      QMessageBox.No)
         if reply == QMessageBox.Yes:
+            self.cancelQueries()
+            self.pool.waitForDone()
+            self.db.close()
             event.accept()
         else:
             event.ignore()
@@ -587,4 +1350,14 @@ if __name__ == "__main__":
 
     win = Window()
     win.show()
+    if PROFILE_STARTUP:
+        startupProfile.mark('window shown')
+    # Окно уже отрисовано, теперь можно загрузить pyqtgraph и создать график
+    app.processEvents()
+    # Базу по умолчанию проверяем так же, как открытую через Connect DB
+    win.checkDatabase()
+    win.ensurePlot()
+    if PROFILE_STARTUP:
+        startupProfile.mark('plot ready')
+        QtCore.QTimer.singleShot(0, startupProfile.report)
     sys.exit(app.exec_())
@@ -1,25 +1,104 @@
+from collections import OrderedDict
+
+import numpy as np
 from PyQt5.QtCore import QAbstractTableModel, Qt
 
+import tableFilter
+
+# Rows formatted together, and how many formatted (column, block) pieces to keep
+BLOCK_ROWS = 256
+CACHE_BLOCKS = 1024
+FLOAT_DECIMALS = 3
+
+
+def format_block(values):
+    """Display strings for a slice of one column."""
+    kind = values.dtype.kind
+    if kind == 'f':
+        text = np.char.mod(f'%.{FLOAT_DECIMALS}f', values).astype(object)
+        text[np.isnan(values)] = ''
+        return text
+    if kind == 'M':
+        unit = 's' if (values.astype('datetime64[ms]').astype(np.int64) % 1000 == 0).all() else 'ms'
+        text = np.char.replace(np.datetime_as_string(values, unit=unit), 'T', ' ').astype(object)
+        text[np.isnat(values)] = ''
+        return text
+    if kind in 'iub':
+        return values.astype(str).astype(object)
+    return np.array(['' if value is None else str(value) for value in values], dtype=object)
+
 
 class PandasModel(QAbstractTableModel):
 
     def __init__(self, data):
         QAbstractTableModel.__init__(self)
         self._data = data
+        # Столбцы храним как массивы NumPy, а строки для показа форматируем блоками по запросу
+        self._columns = [data.iloc[:, i].to_numpy() for i in range(data.shape[1])]
+        self._headers = [str(name) for name in data.columns]
+        self._rows = data.shape[0]
+        # Порядок строк после сортировки/фильтра; None - исходный порядок
+        self._order = None
+        self._blocks = OrderedDict()
 
     def rowCount(self, parent=None):
-        return self._data.shape[0]
+        return self._rows
 
     def columnCount(self, parent=None):
-        return self._data.shape[1]
+        return len(self._columns)
 
     def data(self, index, role=Qt.DisplayRole):
         if index.isValid():
             if role == Qt.DisplayRole:
-                return str(self._data.iloc[index.row(), index.column()])
+                row = index.row()
+                return self._block(index.column(), row // BLOCK_ROWS)[row % BLOCK_ROWS]
         return None
 
+    def arrange(self, order=None, conditions=()):
+        """Sort by order=(column, descending) and keep the rows matching conditions.
+
+        Only the row permutation changes; the column arrays are never copied.
+        Raises ValueError for conditions that cannot be applied.
+        """
+        columns = dict(zip(self._headers, self._columns))
+        keep = tableFilter.mask(conditions, columns)
+        rows = None if keep is None else np.flatnonzero(keep)
+        if order is not None:
+            name, descending = order
+            key = columns[name] if rows is None else columns[name][rows]
+            if key.dtype == object:
+                key = key.astype(str)
+            # Устойчивая сортировка; при убывании порядок равных строк сохраняется
+            ranks = np.argsort(key[::-1] if descending else key, kind='stable')
+            if descending:
+                ranks = (len(key) - 1 - ranks)[::-1]
+            rows = ranks if rows is None else rows[ranks]
+        self.beginResetModel()
+        self._order = rows
+        self._rows = self._data.shape[0] if rows is None else len(rows)
+        self._blocks.clear()
+        self.endResetModel()
+
+    def _block(self, col, block):
+        key = col, block
+        text = self._blocks.get(key)
+        if text is None:
+            start = block * BLOCK_ROWS
+            column = self._columns[col]
+            if self._order is None:
+                values = column[start:start + BLOCK_ROWS]
+            else:
+                values = column[self._order[start:start + BLOCK_ROWS]]
+            text = self._blocks[key] = format_block(values)
+            if len(self._blocks) > CACHE_BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(key)
+        return text
+
     def headerData(self, col, orientation, role):
-        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
-            return self._data.columns[col]
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                return self._headers[col]
+            return col + 1 if self._order is None else int(self._order[col]) + 1
         return None
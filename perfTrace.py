@@ -0,0 +1,196 @@
+"""Timing spans of user actions: where an import, a query or a plot spent its time.
+
+A Trace is started for each action and made active on the threads that work
+for it (Trace.active). Code along the way wraps its stages in span('SQL'),
+span('parse'), ...; with no active trace on the thread a span only costs a
+thread-local lookup, so the library modules are instrumented unconditionally.
+A trace finishes when the last hold on it is released, e.g. after the query
+jobs are done and the plot has been painted. A Recorder keeps the history of
+finished traces and can append each one to a JSON-lines log.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Finished traces kept for the timings dialog
+HISTORY = 1000
+PERCENTILES = (50, 90, 99)
+
+_local = threading.local()
+
+
+def current():
+    """The trace active on this thread, or None."""
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(stage):
+    """Add the time spent in the block to stage of the active trace."""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        yield
+        return
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - began)
+
+
+def add(stage, seconds):
+    trace = current()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+def count(name, value):
+    """Add value to the counter name (points, rows) of the active trace."""
+    trace = current()
+    if trace is not None:
+        trace.count(name, value)
+
+
+def merge(stages):
+    """Add {stage: seconds} measured elsewhere, e.g. in a worker process."""
+    for stage, seconds in stages.items():
+        add(stage, seconds)
+
+
+def format_count(value):
+    if value >= 10 ** 6:
+        return f'{value / 10 ** 6:.1f}M'
+    if value >= 10 ** 4:
+        return f'{value / 1000:.0f}k'
+    return f'{value:,}'
+
+
+class Trace:
+    """Stage times and counters of one action.
+
+    finished(trace) is called, on the thread that releases the last hold,
+    when the action is over. The creator holds the trace until it calls
+    release(); anything that works for the action later holds it as well.
+    """
+
+    def __init__(self, action, detail='', finished=None):
+        self.action = action
+        self.detail = detail
+        self.started = time.time()
+        self.stages = {}
+        self.counts = {}
+        self.status = 'ok'
+        self.total = None
+        self._began = time.perf_counter()
+        self._finished = finished
+        self._holds = 1
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name, value):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def hold(self):
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        with self._lock:
+            self._holds -= 1
+            done = self._holds == 0
+        if done:
+            self.total = time.perf_counter() - self._began
+            if self._finished is not None:
+                self._finished(self)
+
+    @contextmanager
+    def active(self):
+        """Make this the trace that span() records into on the calling thread."""
+        previous = getattr(_local, 'trace', None)
+        _local.trace = self
+        try:
+            yield self
+        finally:
+            _local.trace = previous
+
+    def title(self):
+        return f'{self.action} {self.detail}'.strip()
+
+    def summary(self):
+        """'SQL 120 ms · parse 40 ms · render 300 ms · 2.1M pts'; stages under 1 ms are left out."""
+        parts = [f'{stage} {seconds * 1000:.0f} ms' for stage, seconds in self.stages.items() if seconds >= 0.001]
+        parts.extend(f'{format_count(value)} {name}' for name, value in self.counts.items())
+        head = f'{self.title()} {self.total or 0:.2f} s' + ('' if self.status == 'ok' else f' ({self.status})')
+        return ' · '.join([head] + parts)
+
+    def record(self):
+        """JSON-ready dict of a finished trace."""
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'action': self.action,
+            'detail': self.detail,
+            'status': self.status,
+            'total_ms': round((self.total or 0) * 1000, 3),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            'counts': dict(self.counts),
+        }
+
+
+class Recorder:
+    """History of finished traces, optionally appended to a JSON-lines file."""
+
+    def __init__(self, log_path=None, limit=HISTORY):
+        self.history = deque(maxlen=limit)
+        self.log_path = None
+        self._log = None
+        if log_path:
+            self.open_log(log_path)
+
+    def record(self, trace):
+        record = trace.record()
+        self.history.append(record)
+        if self._log is not None:
+            try:
+                self._log.write(json.dumps(record) + '\n')
+                self._log.flush()
+            except OSError:
+                # Диск полон или файл пропал - лог отключаем, приложение работает дальше
+                self.close_log()
+        return record
+
+    def open_log(self, path):
+        self.close_log()
+        self._log = open(path, 'a', encoding='utf-8')
+        self.log_path = path
+
+    def close_log(self):
+        if self._log is not None:
+            try:
+                self._log.close()
+            except OSError:
+                pass
+        self._log = None
+        self.log_path = None
+
+    def clear(self):
+        self.history.clear()
+
+    def percentiles(self):
+        """{action: {stage: (runs, p50, p90, p99 in ms)}}, 'total' included, over the history."""
+        samples = {}
+        for record in self.history:
+            stages = samples.setdefault(record['action'], {})
+            stages.setdefault('total', []).append(record['total_ms'])
+            for stage, ms in record['stages_ms'].items():
+                stages.setdefault(stage, []).append(ms)
+        return {action: {stage: (len(values),) + tuple(np.percentile(values, PERCENTILES).tolist())
+                         for stage, values in stages.items()}
+                for action, stages in samples.items()}
@@ -0,0 +1,64 @@
+import sqlite3
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+# SQLite VM instructions between cancellation checks
+PROGRESS_STEPS = 10000
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class QueryWorker(QRunnable):
+    """Run job(con) on a thread pool with the thread's read connection from db.
+
+    db is a ConnectionManager. The outcome is delivered through signals:
+    finished(result), failed(message) or cancelled(). cancel() may be called
+    from any thread; it interrupts the running statement and makes the
+    progress handler stop any later one.
+    """
+
+    def __init__(self, db, job):
+        super().__init__()
+        self.db = db
+        self.job = job
+        self.signals = WorkerSignals()
+        self._cancelled = False
+        self._con = None
+
+    def run(self):
+        try:
+            self._con = self.db.reader()
+            self._con.set_progress_handler(self._progress, PROGRESS_STEPS)
+            result = self.job(self._con)
+        except Exception as e:
+            if self._cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.failed.emit(str(e))
+        else:
+            if self._cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
+        finally:
+            if self._con is not None:
+                self._con.set_progress_handler(None, 0)
+                self._con = None
+
+    def _progress(self):
+        # Ненулевой результат прерывает текущий запрос SQLite
+        return 1 if self._cancelled else 0
+
+    def cancel(self):
+        self._cancelled = True
+        con = self._con
+        if con is not None:
+            try:
+                con.interrupt()
+            except sqlite3.ProgrammingError:
+                # Соединение уже закрыто - запрос завершился сам
+                pass
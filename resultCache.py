@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Default memory budget for cached plot data
+CACHE_BYTES = 256 * 2 ** 20
+
+
+class ResultCache:
+    """Plot data read for (table, channels, window, rollup level), shared by all plots.
+
+    A request is served from any cached window of the same table and level
+    that covers it and has all its channels, sliced without copying. Entries
+    are dropped least recently used first once their arrays exceed budget
+    bytes, and all entries of a table are dropped when it is written to.
+    Safe to use from the query pool threads.
+    """
+
+    def __init__(self, budget=CACHE_BYTES):
+        self.budget = budget
+        self.size = 0
+        self.hits = self.subrange_hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def generation(self, table):
+        """Token to pass to put(): a read started before an invalidation is not cached."""
+        with self._lock:
+            return self._epoch, self._generations.get(table, 0)
+
+    def get(self, table, channels, level, start, finish):
+        """(x, {channel: y}) for the window, or None."""
+        with self._lock:
+            for key, (x, ys, pairs) in reversed(self._entries.items()):
+                entry_table, entry_level, entry_start, entry_finish = key
+                if (entry_table != table or entry_level != level or entry_start > start or entry_finish < finish
+                        or not all(name in ys for name in channels)):
+                    continue
+                self._entries.move_to_end(key)
+                if entry_start == start and entry_finish == finish:
+                    self.hits += 1
+                    return x, {name: ys[name] for name in channels}
+                self.subrange_hits += 1
+                # Окно - срез по x; у уровней агрегации точки идут парами (min, max) на корзину
+                stamps = x[::2] if pairs else x
+                low = np.searchsorted(stamps, start / 1000, side='left')
+                high = np.searchsorted(stamps, finish / 1000, side='right')
+                if pairs:
+                    low, high = 2 * low, 2 * high
+                return x[low:high], {name: ys[name][low:high] for name in channels}
+            self.misses += 1
+            return None
+
+    def put(self, table, level, start, finish, x, ys, generation):
+        size = x.nbytes + sum(y.nbytes for y in ys.values())
+        with self._lock:
+            if size > self.budget or generation != (self._epoch, self._generations.get(table, 0)):
+                return
+            key = table, level, start, finish
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = x, ys, level is not None
+            self.size += size
+            while self.size > self.budget:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        x, ys, _ = self._entries.pop(key)
+        self.size -= x.nbytes + sum(y.nbytes for y in ys.values())
+
+    def invalidate(self, table=None):
+        """Forget everything cached for table, or for all tables."""
+        with self._lock:
+            for key in [key for key in self._entries if table is None or key[0] == table]:
+                self._drop(key)
+            if table is None:
+                self._epoch += 1
+            else:
+                self._generations[table] = self._generations.get(table, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'subrange_hits': self.subrange_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,129 @@
+"""Streaming export of query results to CSV or Parquet.
+
+Rows are fetched from the cursor and written EXPORT_ROWS at a time, so
+memory stays flat however long the result is. Parquet needs pyarrow, which
+is imported only when a Parquet file is written.
+"""
+import csv
+import os
+
+import numpy as np
+
+from perfTrace import span
+
+# Rows fetched and written at a time
+EXPORT_ROWS = 50000
+
+
+def time_strings(stamps):
+    """Epoch-ms integers -> 'YYYY-MM-DD HH:MM:SS[.fff]' (UTC, as stored)."""
+    stamps = np.asarray(stamps, dtype=np.int64)
+    unit = 's' if (stamps % 1000 == 0).all() else 'ms'
+    return np.char.replace(np.datetime_as_string(stamps.astype('datetime64[ms]'), unit=unit), 'T', ' ')
+
+
+def write_csv(cur, out, chunk=EXPORT_ROWS, progress=None):
+    """Write the rows of an executed cursor to the text stream out as CSV; returns the row count.
+
+    Rows are fetched and written chunk at a time, so memory does not grow
+    with the result. An integer DateTime column is written as a date and time.
+    progress, if given, is called with the rows written so far after every chunk.
+    """
+    names = [column[0] for column in cur.description]
+    time_column = names.index('DateTime') if 'DateTime' in names else None
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(names)
+    total = 0
+    while True:
+        with span('SQL'):
+            rows = cur.fetchmany(chunk)
+        if not rows:
+            break
+        with span('write'):
+            if time_column is not None:
+                stamps = [row[time_column] for row in rows]
+                if all(type(value) is int for value in stamps):
+                    times = time_strings(stamps).tolist()
+                    rows = [row[:time_column] + (text,) + row[time_column + 1:] for row, text in zip(rows, times)]
+            writer.writerows(rows)
+        total += len(rows)
+        if progress is not None:
+            progress(total)
+    return total
+
+
+def arrow_type(pa, name, values):
+    """Parquet column type for the first chunk of a column."""
+    kinds = {type(value) for value in values if value is not None}
+    if name == 'DateTime' and kinds == {int}:
+        # Миллисекунды эпохи, как в базе; время без часового пояса, как его показывает программа
+        return pa.timestamp('ms')
+    if kinds <= {int}:
+        return pa.int64() if kinds else pa.float64()
+    if kinds <= {int, float}:
+        return pa.float64()
+    if kinds == {bytes}:
+        return pa.binary()
+    return pa.string()
+
+
+def write_parquet(cur, path, chunk=EXPORT_ROWS, progress=None):
+    """Write the rows of an executed cursor to a Parquet file; returns the row count.
+
+    Every chunk becomes a row group. Column types are taken from the first
+    chunk: INTEGER columns stay int64 and an integer DateTime becomes a
+    millisecond timestamp.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow); CSV works without it')
+    names = [column[0] for column in cur.description]
+    writer = None
+    total = 0
+    try:
+        while True:
+            with span('SQL'):
+                rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            with span('write'):
+                columns = list(zip(*rows))
+                if writer is None:
+                    schema = pa.schema([(name, arrow_type(pa, name, values)) for name, values in zip(names, columns)])
+                    writer = pq.ParquetWriter(path, schema)
+                try:
+                    arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError) as e:
+                    raise ValueError(f'A column changes type after the first {total:,} rows: {e}')
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            total += len(rows)
+            if progress is not None:
+                progress(total)
+        if writer is None:
+            # Пустой результат: файл со столбцами, но без строк
+            schema = pa.schema([(name, pa.string()) for name in names])
+            writer = pq.ParquetWriter(path, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def export(cur, path, chunk=EXPORT_ROWS, progress=None):
+    """Write an executed cursor to path, as Parquet for *.parquet and CSV otherwise; returns the row count.
+
+    A file left unfinished by an error or a cancelled query is removed.
+    """
+    try:
+        if path.lower().endswith('.parquet'):
+            return write_parquet(cur, path, chunk, progress)
+        with open(path, 'w', newline='', encoding='utf-8') as out:
+            return write_csv(cur, out, chunk, progress)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,215 @@
+import sqlite3
+
+import numpy as np
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+import tableFilter
+from pandasModel import format_block
+from perfTrace import span
+
+# Rows read per page, and how many pages of formatted rows to keep
+PAGE_ROWS = 1000
+MAX_PAGES = 64
+
+
+def read_page(con, sql, params=(), offset=0):
+    """One page of rows of sql: (column names, rows), starting at row offset."""
+    with span('SQL'):
+        if offset:
+            cur = con.execute(f'SELECT * FROM ({sql.strip().rstrip(";")}) LIMIT {PAGE_ROWS} OFFSET ?',
+                              tuple(params) + (offset,))
+        else:
+            cur = con.execute(sql, params)
+        try:
+            names = [column[0] for column in cur.description or ()]
+            rows = cur.fetchmany(PAGE_ROWS) if names else []
+        finally:
+            cur.close()
+    return names, rows
+
+
+def column_array(name, values):
+    array = np.array(values)
+    if array.dtype == object:
+        try:
+            # NULL в числовом столбце становится NaN
+            array = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return array
+    if name == 'DateTime' and array.dtype.kind == 'i':
+        array = array.astype('datetime64[ms]')
+    return array
+
+
+class SqlTableModel(QAbstractTableModel):
+    """Query result read from the database a page at a time.
+
+    The view asks for more rows through canFetchMore/fetchMore as it scrolls.
+    Range queries (sql binds bounds=(start, finish) and selects and orders by
+    its integer key first, as range_sql does) page by key: each page starts
+    after the last DateTime of the one before, so any page is a short indexed
+    read. Other queries page with LIMIT/OFFSET, and every page of them may
+    scan and sort the whole result again; given submit(job, done, failed),
+    those pages are read off the GUI thread: job(con) runs on the query pool,
+    then done(rows) or failed(error) is called on the GUI thread (error is
+    False when the read was cancelled). Cells of a page still being read are
+    blank until it arrives. At most MAX_PAGES pages stay formatted; the ones
+    furthest from the page being shown are dropped and read again if the view
+    scrolls back to them.
+    """
+
+    def __init__(self, db, sql, first, bounds=None, submit=None):
+        QAbstractTableModel.__init__(self)
+        self.db = db
+        self.sql = sql
+        self.bounds = bounds
+        self.submit = submit
+        self._headers = first[0]
+        self.arrange(self.plan(), first)
+
+    def plan(self, order=None, conditions=()):
+        """Query for the result sorted by order=(column, descending) and filtered by conditions.
+
+        Sorting and filtering run in the database as ORDER BY and WHERE around
+        the original query. Returns (sql, params, keyed, descending): read the
+        first page with read_page(con, sql, params) and pass both to arrange().
+        Ordering a range query by its key keeps the key paging.
+        """
+        where, where_params = tableFilter.to_sql(conditions)
+        keyed = self.bounds is not None and (order is None or order[0] == self._headers[0])
+        descending = order is not None and order[1]
+        if order is None and not conditions:
+            sql = self.sql
+        else:
+            sql = f'SELECT * FROM ({self.sql.strip().rstrip(";")}) WHERE {where}'
+            if order is not None:
+                sql += f' ORDER BY "{order[0]}"' + (' DESC' if descending else '')
+            elif keyed:
+                sql += f' ORDER BY "{self._headers[0]}"'
+        return sql, tuple(self.bounds or ()) + where_params, keyed, descending
+
+    def arrange(self, plan, first):
+        """Replace the rows with those of plan, given its first page."""
+        self.beginResetModel()
+        self._plan = plan
+        # Для каждой страницы: параметры запроса и смещение
+        self._starts = [(plan[1], 0)]
+        self._pages = {}
+        self._loading = set()
+        self._rows = 0
+        self._done = False
+        self._add(first[1])
+        self.endResetModel()
+
+    def _add(self, rows):
+        sql, params, keyed, descending = self._plan
+        page = len(self._starts) - 1
+        self._rows += len(rows)
+        if len(rows) < PAGE_ROWS:
+            self._done = True
+        elif not keyed:
+            self._starts.append((params, self._rows))
+        else:
+            key = rows[-1][0]
+            lower, upper = self._starts[-1][0][:2]
+            bounds = (lower, key - 1) if descending else (key + 1, upper)
+            self._starts.append((bounds + params[2:], 0))
+        self._store(page, rows)
+
+    def _store(self, page, rows):
+        self._pages[page] = [format_block(column_array(name, [row[i] for row in rows]))
+                             for i, name in enumerate(self._headers)]
+        if len(self._pages) > MAX_PAGES:
+            del self._pages[max(self._pages, key=lambda loaded: abs(loaded - page))]
+
+    def _read(self, page):
+        params, offset = self._starts[page]
+        try:
+            return read_page(self.db.reader(), self._plan[0], params, offset)[1]
+        except sqlite3.Error:
+            # База закрыта или сменилась - больше ничего не читаем
+            self._done = True
+            return None
+
+    def _deferred(self):
+        return self.submit is not None and not self._plan[2]
+
+    def _request(self, page, done):
+        """Read page through submit and pass its rows to done(), unless the plan has changed by then."""
+        if page in self._loading:
+            return
+        self._loading.add(page)
+        plan = self._plan
+        params, offset = self._starts[page]
+
+        def finished(rows):
+            if self._plan is plan:
+                self._loading.discard(page)
+                done(rows)
+
+        def failed(error):
+            if self._plan is plan:
+                self._loading.discard(page)
+                # После ошибки дальше не читаем; отменённую страницу прочитаем при следующей прокрутке
+                self._done = self._done or error
+
+        self.submit(lambda con: read_page(con, plan[0], params, offset)[1], finished, failed)
+
+    def _append(self, rows):
+        if rows:
+            self.beginInsertRows(QModelIndex(), self._rows, self._rows + len(rows) - 1)
+            self._add(rows)
+            self.endInsertRows()
+        else:
+            self._done = True
+
+    def _reloaded(self, page, rows):
+        if rows:
+            self._store(page, rows)
+            low = page * PAGE_ROWS
+            high = min(low + PAGE_ROWS, self._rows) - 1
+            self.dataChanged.emit(self.index(low, 0), self.index(high, len(self._headers) - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._done
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        page = len(self._starts) - 1
+        if self._deferred():
+            self._request(page, self._append)
+        else:
+            self._append(self._read(page))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid():
+            if role == Qt.DisplayRole:
+                page, row = divmod(index.row(), PAGE_ROWS)
+                columns = self._pages.get(page)
+                if columns is None:
+                    if self._deferred():
+                        self._request(page, lambda rows: self._reloaded(page, rows))
+                        return None
+                    rows = self._read(page)
+                    if not rows:
+                        return None
+                    self._store(page, rows)
+                    columns = self._pages[page]
+                column = columns[index.column()]
+                # Перечитанная страница могла стать короче, если данные изменились
+                return column[row] if row < len(column) else None
+        return None
+
+    def headerData(self, col, orientation, role):
+        if role == Qt.DisplayRole:
+            if orientation == Qt.Horizontal:
+                return self._headers[col]
+            return col + 1
+        return None
@@ -0,0 +1,52 @@
+"""Import-time breakdown of the GUI startup: python main.py --profile-startup
+
+install() must run before the imports it is meant to time. Every import
+statement that loads a new module outside another import is timed,
+including what that module imports in turn, so the list adds up to the time
+spent importing. Interpreter startup before main.py runs is not included.
+"""
+import builtins
+import sys
+import threading
+import time
+
+START = time.perf_counter()
+
+_imports = []
+_marks = []
+_local = threading.local()
+
+
+def install():
+    original = builtins.__import__
+
+    def timed(name, globals=None, locals=None, fromlist=(), level=0):
+        if getattr(_local, 'depth', 0) or level or name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        _local.depth = 1
+        began = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            _local.depth = 0
+            _imports.append((name, time.perf_counter() - began))
+
+    builtins.__import__ = timed
+
+
+def mark(label):
+    """Record a startup milestone, timed from START."""
+    _marks.append((label, time.perf_counter() - START))
+
+
+def report(out=None):
+    out = out or sys.stderr
+    total = sum(seconds for _, seconds in _imports)
+    print('Imports (ms, including what they import):', file=out)
+    for name, seconds in sorted(_imports, key=lambda item: -item[1]):
+        if seconds >= 0.001:
+            print(f'  {seconds * 1000:8.1f}  {name}', file=out)
+    print(f'  {total * 1000:8.1f}  total', file=out)
+    print('Milestones (ms since main.py started):', file=out)
+    for label, seconds in _marks:
+        print(f'  {seconds * 1000:8.1f}  {label}', file=out)
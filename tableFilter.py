@@ -0,0 +1,81 @@
+import operator
+import re
+
+import numpy as np
+
+import turbineSchema
+
+OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+CONDITION = re.compile(r'^"?(\w+)"?\s*(==|=|!=|<>|<=|>=|<|>)\s*(.+)$')
+SEPARATOR = re.compile(r'\s+and\s+', re.I)
+
+
+def parse(text, columns):
+    """Conditions of a filter such as 'TurbineExitTemp > 600 and EngineSpeed < 90000'.
+
+    Returns [(column, op, value)], all of which must hold. Values are numbers
+    or quoted strings; DateTime takes 'YYYY-MM-DD HH:MM:SS'. Raises
+    ValueError for anything else.
+    """
+    names = {name.lower(): name for name in columns}
+    conditions = []
+    for part in SEPARATOR.split(text.strip()) if text.strip() else []:
+        match = CONDITION.match(part.strip())
+        if match is None:
+            raise ValueError(f'Cannot read filter condition "{part}"')
+        column, op, value = match.groups()
+        if column.lower() not in names:
+            raise ValueError(f'No column {column} in the result')
+        column = names[column.lower()]
+        value = value.strip()
+        if len(value) > 1 and value[0] == value[-1] and value[0] in '\'"':
+            value = value[1:-1]
+        elif column != 'DateTime':
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError(f'Not a number: {value}') from None
+        if column == 'DateTime':
+            try:
+                turbineSchema.epoch_ms(value)
+            except ValueError:
+                raise ValueError(f'Not a date and time: {value}') from None
+        conditions.append((column, op, value))
+    return conditions
+
+
+def to_sql(conditions):
+    """WHERE clause and its parameters for conditions ('1' when there are none)."""
+    if not conditions:
+        return '1', ()
+    terms, params = [], []
+    for column, op, value in conditions:
+        terms.append(f'"{column}" {"=" if op == "==" else op} ?')
+        # DateTime хранится в базе как миллисекунды эпохи
+        params.append(turbineSchema.epoch_ms(value) if column == 'DateTime' else value)
+    return ' AND '.join(terms), tuple(params)
+
+
+def mask(conditions, columns):
+    """Boolean row mask of conditions over {name: NumPy array}; None when there are none."""
+    result = None
+    for column, op, value in conditions:
+        values = columns[column]
+        if column == 'DateTime':
+            value = (np.datetime64(value.replace(' ', 'T')) if values.dtype.kind == 'M'
+                     else turbineSchema.epoch_ms(value))
+        try:
+            hit = np.asarray(OPERATORS[op](values, value), dtype=bool)
+        except TypeError:
+            raise ValueError(f'Cannot compare {column} with {value!r}') from None
+        result = hit if result is None else result & hit
+    return result
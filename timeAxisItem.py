@@ -1,7 +1,56 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+
 import pyqtgraph as pg
-from datetime import datetime
+
+# Label formats by the smallest tick spacing (s) they can tell apart
+FORMATS = [
+    (366 * 86400, '%Y'),
+    (31 * 86400, '%Y-%m'),
+    (86400, '%Y-%m-%d'),
+    (60, '%H:%M'),
+    (1, '%H:%M:%S'),
+    (0, '%H:%M:%S.%f'),
+]
+# Formatted labels kept between repaints
+LABEL_CACHE = 4096
+
+
+def format_time(value, fmt):
+    try:
+        # Время в БД хранится как UTC (см. turbineSchema), поэтому и показываем в UTC
+        moment = datetime.fromtimestamp(value, timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return ''
+    if fmt.startswith('%H') and moment.hour == moment.minute == moment.second == moment.microsecond == 0:
+        return moment.strftime('%Y-%m-%d')
+    if fmt.endswith('%f'):
+        return moment.strftime(fmt)[:-3]
+    return moment.strftime(fmt)
 
 
 class TimeAxisItem(pg.AxisItem):
+    """Bottom axis for epoch seconds, labelled as UTC at a precision matching the tick spacing.
+
+    Below a day the labels show the time of day only, except at midnight
+    where they show the date.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._labels = OrderedDict()
+
     def tickStrings(self, values, scale, spacing):
-        return [datetime.fromtimestamp(value) for value in values]
+        fmt = next(fmt for step, fmt in FORMATS if spacing >= step)
+        return [self._label(value, fmt) for value in values]
+
+    def _label(self, value, fmt):
+        key = value, fmt
+        label = self._labels.get(key)
+        if label is None:
+            label = self._labels[key] = format_time(value, fmt)
+            if len(self._labels) > LABEL_CACHE:
+                self._labels.popitem(last=False)
+        else:
+            self._labels.move_to_end(key)
+        return label
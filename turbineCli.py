@@ -0,0 +1,128 @@
+"""Command line access to a turbine database, without the GUI.
+
+    python turbineCli.py ingest exports/*.csv --table MT125
+    python turbineCli.py query --table MT125 --from 2021-03-01 --to "2021-03-02 12:00:00" --cols EngineSpeed,Hours
+    python turbineCli.py export --table MT125 --from 2021-03-01 --to 2021-04-01 --out march.parquet
+
+query writes CSV to standard output. export writes a CSV file, or a Parquet
+file (needs pyarrow) when --out ends in .parquet. Times are read and written
+as UTC wall-clock, like the GUI shows them. Only the non-GUI modules are
+imported, so this runs where PyQt5 is not installed.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+import resultExport
+import turbineQuery
+import turbineSchema
+from connectionManager import ConnectionManager
+
+DEFAULT_DB = 'turbinist.db'
+TIME_FORMATS = [turbineSchema.QUERY_FORMAT, '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+
+def parse_time(text):
+    """Command line date/time -> epoch ms."""
+    for fmt in TIME_FORMATS:
+        try:
+            return turbineSchema.epoch_ms(text, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f'expected YYYY-MM-DD[ HH:MM[:SS]], got {text!r}')
+
+
+def ingest(args):
+    # capstoneImport тянет pandas, который нужен только импорту
+    import capstoneImport
+    paths = []
+    for pattern in args.files:
+        found = capstoneImport.expand_paths(pattern)
+        if not found:
+            print(f'{pattern}: no CSV files', file=sys.stderr)
+        paths.extend(found)
+    if not paths:
+        return 1
+    progress = None if args.quiet else lambda report: print(report, file=sys.stderr)
+    reports = capstoneImport.import_batch(paths, args.db, args.table, workers=args.workers, progress=progress)
+    for report in reports:
+        print(report)
+    failed = sum(report.error is not None for report in reports)
+    print(f'{len(reports)} files, {sum(report.stored for report in reports):,} rows stored'
+          + (f', {failed} failed' if failed else ''))
+    return 1 if failed else 0
+
+
+def select(args):
+    """Open cursor over the rows asked for by query/export arguments."""
+    con = ConnectionManager(args.db).reader()
+    if not turbineSchema.table_exists(con, args.table):
+        raise SystemExit(f'No table {args.table} in {args.db}')
+    if not turbineSchema.is_managed(con, args.table):
+        # Текстовый DateTime не совпадает с числовыми границами - запрос вернул бы пустоту
+        raise SystemExit(f'{args.table} stores DateTime as text; migrate it first: python turbineSchema.py {args.db}')
+    stored = turbineSchema.table_columns(con, args.table)
+    columns = args.cols.split(',') if args.cols else [name for name in turbineSchema.CHANNELS if name in stored]
+    unknown = [name for name in columns if name not in stored or name == 'DateTime']
+    if unknown:
+        raise SystemExit(f'Unknown columns: {", ".join(unknown)}')
+    start = args.start if args.start is not None else -2 ** 63
+    finish = args.finish if args.finish is not None else 2 ** 63 - 1
+    return con.execute(turbineQuery.range_sql(args.table, columns, args.level), (start, finish))
+
+
+def query(args):
+    resultExport.write_csv(select(args), sys.stdout)
+    return 0
+
+
+def export(args):
+    rows = resultExport.export(select(args), args.out)
+    print(f'{rows:,} rows -> {args.out}', file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Import and read Capstone turbine data without the GUI.')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'database file (default {DEFAULT_DB})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('ingest', help='import Capstone CSV exports')
+    command.add_argument('files', nargs='+', help='CSV files, folders or glob patterns')
+    command.add_argument('--table', help='target table (default: MTxxx taken from each file name)')
+    command.add_argument('--workers', type=int, help='parser processes (default: CPU count)')
+    command.add_argument('--quiet', action='store_true', help='no per-file progress')
+    command.set_defaults(run=ingest)
+
+    for name, run, text in (('query', query, 'print rows as CSV'), ('export', export, 'write rows to a CSV or Parquet file')):
+        command = commands.add_parser(name, help=text)
+        command.add_argument('--table', required=True)
+        command.add_argument('--from', dest='start', type=parse_time, help='first time, YYYY-MM-DD[ HH:MM[:SS]]')
+        command.add_argument('--to', dest='finish', type=parse_time, help='last time, inclusive')
+        command.add_argument('--cols', help='comma-separated channels (default: all)')
+        command.add_argument('--level', choices=[level for level, _ in turbineSchema.ROLLUPS],
+                             help='read a rollup (mean, min, max per bucket) instead of raw rows')
+        if name == 'export':
+            command.add_argument('--out', required=True, help='output file, .csv or .parquet')
+        command.set_defaults(run=run)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.run(args)
+    except sqlite3.Error as e:
+        raise SystemExit(f'{args.db}: {e}')
+    except (RuntimeError, ValueError) as e:
+        # Нет pyarrow или столбец меняет тип посреди выгрузки в Parquet
+        raise SystemExit(str(e))
+    except BrokenPipeError:
+        # Вывод оборвали (например, | head) - это не ошибка данных
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
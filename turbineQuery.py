@@ -0,0 +1,238 @@
+from itertools import chain
+
+import numpy as np
+
+import turbineSchema
+from perfTrace import span
+
+# Rows the query dialog aims for before it switches to a rollup level
+QUERY_POINTS = 10000
+# Rows converted to NumPy at a time when reading plot data
+FETCH_ROWS = 100000
+# Longest common time grid for the side-by-side view of several tables
+ALIGN_ROWS = 1000000
+
+
+def range_sql(table, columns, level=None):
+    """SQL used by the query and plot dialogs; bind (start_ms, finish_ms).
+
+    With a rollup level each channel comes back as its mean plus
+    <channel>_min and <channel>_max columns.
+    """
+    if level is None:
+        return (f'SELECT DateTime, {", ".join(columns)} FROM "{table}" '
+                f'WHERE DateTime BETWEEN ? AND ? ORDER BY DateTime')
+    select = ', '.join(f'"{name}_sum" / NULLIF("{name}_count", 0) AS {name}, {name}_min, {name}_max'
+                       for name in columns)
+    return (f'SELECT DateTime, {select} FROM "{turbineSchema.rollup_table(table, level)}" '
+            f'WHERE DateTime BETWEEN ? AND ? ORDER BY DateTime')
+
+
+def count_range(con, table, start, finish, level=None):
+    """Rows range_sql returns for the window."""
+    name = table if level is None else turbineSchema.rollup_table(table, level)
+    with span('SQL'):
+        return con.execute(f'SELECT COUNT(*) FROM "{name}" WHERE DateTime BETWEEN ? AND ?',
+                           (start, finish)).fetchone()[0]
+
+
+def pick_level(con, table, start, finish, points):
+    """Coarsest rollup level with at least `points` buckets in the window; None for raw rows."""
+    best = None
+    for level, size in turbineSchema.ROLLUPS:
+        if (finish - start) / size >= points and turbineSchema.table_exists(
+                con, turbineSchema.rollup_table(table, level)):
+            best = level
+    return best
+
+
+def bucket_size(level):
+    return dict(turbineSchema.ROLLUPS)[level]
+
+
+def iter_columns(con, sql, params, width, chunk=FETCH_ROWS):
+    """Run sql and yield its result as (width, rows) float64 arrays of up to chunk rows.
+
+    NULL becomes NaN.
+    """
+    with span('SQL'):
+        cur = con.execute(sql, params)
+    while True:
+        with span('SQL'):
+            rows = cur.fetchmany(chunk)
+        if not rows:
+            break
+        with span('convert'):
+            try:
+                part = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * width)
+            except TypeError:
+                # В чанке есть NULL: np.array превращает None в NaN
+                part = np.array(rows, dtype=np.float64)
+        yield part.reshape(-1, width).T
+
+
+def fetch_columns(con, sql, params, width, chunk=FETCH_ROWS):
+    """Run sql and return its result as a (width, rows) float64 array.
+
+    Rows are converted a chunk at a time, NULL becomes NaN, and every
+    column comes out as a contiguous row of the array.
+    """
+    parts = list(iter_columns(con, sql, params, width, chunk))
+    if not parts:
+        return np.empty((width, 0))
+    return np.ascontiguousarray(np.concatenate(parts, axis=1))
+
+
+def read_level(con, table, columns, start, finish, level):
+    """x in seconds and {channel: y} for the window at a rollup level (None for raw rows).
+
+    Rollup buckets are expanded to their min and max, placed at the start and
+    the middle of the bucket, so peaks survive the reduction.
+    """
+    width = 1 + len(columns) * (1 if level is None else 3)
+    data = fetch_columns(con, range_sql(table, columns, level), (start, finish), width)
+    x = data[0] / 1000
+    if level is None:
+        return x, dict(zip(columns, data[1:]))
+    x = (x[:, None] + [0, bucket_size(level) / 2000]).ravel()
+    series = {}
+    for i, name in enumerate(columns):
+        # Колонки уровня: среднее, min, max для каждого канала
+        series[name] = np.column_stack([data[2 + 3 * i], data[3 + 3 * i]]).ravel()
+    return x, series
+
+
+def read_columns(con, table, columns, start, finish, points=QUERY_POINTS):
+    """Epoch-ms stamps, {channel: values} and the level read, for aligning tables.
+
+    Rollup levels give the bucket means.
+    """
+    level = pick_level(con, table, start, finish, points)
+    width = 1 + len(columns) * (1 if level is None else 3)
+    data = fetch_columns(con, range_sql(table, columns, level), (start, finish), width)
+    values = data[1:] if level is None else data[1::3]
+    return data[0].astype(np.int64), dict(zip(columns, values)), level
+
+
+def sample_step(stamps, level):
+    """Typical interval between rows of a read, ms."""
+    if level is not None:
+        return bucket_size(level)
+    if len(stamps) < 2:
+        return 1000
+    return max(int(np.median(np.diff(stamps))), 1)
+
+
+def align(reads, start, finish):
+    """Frame of several tables side by side on one time grid.
+
+    reads is {table: (stamps, {channel: values}, level)} as read_columns
+    returns. The grid steps at the coarsest interval of the reads (no finer
+    than ALIGN_ROWS rows over the window). Every grid row takes, for each
+    table, its last row at or before the grid time and less than one step
+    earlier (an as-of join); missing cells are NaN. Columns are named
+    <channel>_<table>.
+    """
+    import pandas as pd
+    with span('align'):
+        step = max(sample_step(stamps, level) for stamps, _, level in reads.values())
+        step = max(step, -(-(finish - start) // ALIGN_ROWS))
+        grid = np.arange(start + (-start) % step, finish + 1, step, dtype=np.int64)
+        frame = {'DateTime': grid.astype('datetime64[ms]')}
+        for table, (stamps, values, _) in reads.items():
+            index = np.searchsorted(stamps, grid, side='right') - 1
+            if len(stamps):
+                found = (index >= 0) & (grid - stamps[np.maximum(index, 0)] < step)
+            else:
+                found = np.zeros(len(grid), dtype=bool)
+            index = np.where(found, index, 0)
+            for name, column in values.items():
+                frame[f'{name}_{table}'] = np.where(found, column[index] if len(column) else np.nan, np.nan)
+        return pd.DataFrame(frame)
+
+
+class SeriesWindow:
+    """Plot data for some channels of one table, over the window loaded last.
+
+    With a ColumnStore raw rows are taken from its memory-mapped files, which
+    needs no rollups; otherwise with a ResultCache windows are looked up there
+    before reading the database.
+    """
+
+    def __init__(self, table, channels, cache=None, columns=None):
+        self.table = table
+        self.channels = channels
+        self.cache = cache
+        self.columns = columns
+        self.x = np.empty(0)
+        self.ys = {name: np.empty(0) for name in channels}
+        self.start = self.finish = None
+        self.level = None
+
+    def covers(self, con, start, finish, points):
+        """True if [start, finish] is loaded at the resolution `points` calls for."""
+        if self.start is None or start < self.start or finish > self.finish:
+            return False
+        return self.level is None or pick_level(con, self.table, start, finish, points) == self.level
+
+    def fetch(self, con, start, finish, points):
+        """Read a window without touching self; pass the result to apply().
+
+        Safe to call from a worker thread while the GUI keeps drawing the
+        current data.
+        """
+        if self.columns is not None:
+            mapped = self.columns.read(con, self.table, self.channels, start, finish)
+            if mapped is not None:
+                return (start, finish) + mapped + (None,)
+        level = pick_level(con, self.table, start, finish, points)
+        if self.cache is None:
+            return (start, finish) + read_level(con, self.table, self.channels, start, finish, level) + (level,)
+        with span('cache'):
+            cached = self.cache.get(self.table, self.channels, level, start, finish)
+        if cached is None:
+            generation = self.cache.generation(self.table)
+            cached = read_level(con, self.table, self.channels, start, finish, level)
+            self.cache.put(self.table, level, start, finish, *cached, generation)
+        return (start, finish) + cached + (level,)
+
+    def apply(self, window):
+        self.start, self.finish, self.x, self.ys, self.level = window
+
+    def load(self, con, start, finish, points):
+        self.apply(self.fetch(con, start, finish, points))
+
+
+def range_params(start, finish):
+    """Date picker strings -> (start_ms, finish_ms) for range_sql."""
+    return turbineSchema.epoch_ms(start), turbineSchema.epoch_ms(finish)
+
+
+def explain(con, sql, params=()):
+    """Detail lines of EXPLAIN QUERY PLAN for sql."""
+    return [row[-1] for row in con.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def plan_warnings(plan):
+    """Steps of a query plan that read the whole table or sort in a temp b-tree."""
+    warnings = []
+    for detail in plan:
+        if detail.startswith('SCAN') and 'USING' not in detail:
+            warnings.append(f'full table scan: {detail}')
+        elif 'TEMP B-TREE' in detail:
+            warnings.append(f'extra sort: {detail}')
+    return warnings
+
+
+def check_plans(con, tables=None):
+    """Explain range_sql for every turbine table; returns {table: (plan, warnings)}."""
+    result = {}
+    for table in tables or turbineSchema.turbine_tables(con):
+        sql = range_sql(table, [name for name in turbineSchema.CHANNELS
+                                if name in turbineSchema.table_columns(con, table)])
+        plan = explain(con, sql, (0, 0))
+        warnings = plan_warnings(plan)
+        if not turbineSchema.is_managed(con, table):
+            warnings.insert(0, 'text DateTime: range queries find nothing until the table is migrated')
+        result[table] = plan, warnings
+    return result
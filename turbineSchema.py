@@ -0,0 +1,226 @@
+"""Managed schema for turbine tables (MT125, MT127, ...).
+
+DateTime is stored as INTEGER milliseconds since the epoch. Capstone logs
+carry no time zone, so the wall-clock time is encoded as if it were UTC and
+must be decoded the same way (see TimeAxisItem).
+
+Run as a script to migrate an older database in place:
+
+    python turbineSchema.py turbinist.db
+"""
+import calendar
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import numpy as np
+
+CHANNELS = {
+    'IncidentRecord': 'INTEGER',
+    'EngineSpeed': 'REAL',
+    'MainGenPower': 'REAL',
+    'TurbineExitTemp': 'REAL',
+    'FuelValveCommand': 'REAL',
+    'FuelInletPres': 'REAL',
+    'BatSOC': 'REAL',
+    'SecBatSOC': 'REAL',
+    'Starts': 'INTEGER',
+    'Hours': 'REAL',
+    'OutCurA': 'REAL',
+    'OutCurB': 'REAL',
+    'OutCurC': 'REAL',
+    'OutCurN': 'REAL',
+}
+
+QUERY_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Rollup levels, finest first: name suffix and bucket size in ms
+ROLLUPS = [
+    ('1m', 60 * 1000),
+    ('1h', 60 * 60 * 1000),
+    ('1d', 24 * 60 * 60 * 1000),
+]
+
+
+def create_table(con, table):
+    columns = ''.join(f', "{name}" {kind}' for name, kind in CHANNELS.items())
+    con.execute(f'CREATE TABLE IF NOT EXISTS "{table}" '
+                f'(DateTime INTEGER PRIMARY KEY NOT NULL{columns}) WITHOUT ROWID')
+
+
+def table_exists(con, table):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (table,)).fetchone() is not None
+
+
+def table_columns(con, table):
+    return [column[1] for column in con.execute(f'PRAGMA table_info("{table}")')]
+
+
+def is_managed(con, table):
+    """True if table already uses the integer DateTime key."""
+    for _, name, kind, _, _, pk in con.execute(f'PRAGMA table_info("{table}")'):
+        if name == 'DateTime':
+            return kind.upper() == 'INTEGER' and pk == 1
+    return False
+
+
+def turbine_tables(con):
+    """Names of all tables that have a DateTime column, rollups excluded."""
+    names = [name for name, in con.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                           "AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    return [name for name in names if '__' not in name and 'DateTime' in table_columns(con, name)]
+
+
+def legacy_tables(con):
+    """Turbine tables still storing DateTime as text."""
+    return [name for name in turbine_tables(con) if not is_managed(con, name)]
+
+
+def rollup_table(table, level):
+    return f'{table}__{level}'
+
+
+def create_rollups(con, table):
+    """Create the rollup tables of table; returns True if any was missing.
+
+    Each bucket row keeps min, max, sum and count per channel so that coarser
+    levels can be merged from finer ones and mean = sum / count.
+    """
+    missing = False
+    columns = ''.join(f', "{name}_min" {kind}, "{name}_max" {kind}, "{name}_sum" REAL, "{name}_count" INTEGER'
+                      for name, kind in CHANNELS.items())
+    for level, _ in ROLLUPS:
+        name = rollup_table(table, level)
+        missing = missing or not table_exists(con, name)
+        con.execute(f'CREATE TABLE IF NOT EXISTS "{name}" '
+                    f'(DateTime INTEGER PRIMARY KEY NOT NULL{columns}) WITHOUT ROWID')
+    return missing
+
+
+def refresh_rollups(con, table, start, end, from_minutes=False):
+    """Recompute every rollup bucket that overlaps [start, end] (epoch ms).
+
+    Minutes are aggregated from the raw rows, hours from minutes and days
+    from hours, so the cost follows the size of the changed range. With
+    from_minutes the minute level is taken as up to date (see merge_minutes).
+    """
+    levels = ROLLUPS[1:] if from_minutes else ROLLUPS
+    source = rollup_table(table, ROLLUPS[0][0]) if from_minutes else table
+    for level, size in levels:
+        low = start - start % size
+        high = end - end % size + size
+        target = rollup_table(table, level)
+        if source == table:
+            aggregates = ''.join(f', MIN("{name}"), MAX("{name}"), TOTAL("{name}"), COUNT("{name}")'
+                                 for name in CHANNELS)
+        else:
+            aggregates = ''.join(f', MIN("{name}_min"), MAX("{name}_max"), TOTAL("{name}_sum"), '
+                                 f'SUM("{name}_count")' for name in CHANNELS)
+        con.execute(f'DELETE FROM "{target}" WHERE DateTime >= ? AND DateTime < ?', (low, high))
+        con.execute(f'INSERT INTO "{target}" SELECT (DateTime / {size}) * {size} AS Bucket{aggregates} '
+                    f'FROM "{source}" WHERE DateTime >= ? AND DateTime < ? GROUP BY Bucket', (low, high))
+        source = target
+
+
+def merge_minutes(con, table, stamps, frame):
+    """Fold rows that were just inserted into the minute rollup.
+
+    stamps are the epoch ms of frame's rows. Aggregation happens in pandas
+    and is upserted, so only the new rows are read.
+    """
+    if not len(stamps):
+        return
+    names = [name for name in CHANNELS if name in frame]
+    size = ROLLUPS[0][1]
+    agg = frame[names].groupby(stamps - stamps % size).agg(['min', 'max', 'sum', 'count'])
+    update = ', '.join(
+        f'"{name}_min" = MIN(COALESCE("{name}_min", excluded."{name}_min"), '
+        f'COALESCE(excluded."{name}_min", "{name}_min")), '
+        f'"{name}_max" = MAX(COALESCE("{name}_max", excluded."{name}_max"), '
+        f'COALESCE(excluded."{name}_max", "{name}_max")), '
+        f'"{name}_sum" = "{name}_sum" + excluded."{name}_sum", '
+        f'"{name}_count" = "{name}_count" + excluded."{name}_count"' for name in names)
+    columns = ''.join(f', "{name}_{func}"' for name in names for func in ('min', 'max', 'sum', 'count'))
+    sql = (f'INSERT INTO "{rollup_table(table, ROLLUPS[0][0])}" (DateTime{columns}) '
+           f'VALUES ({", ".join("?" * (1 + 4 * len(names)))}) '
+           f'ON CONFLICT (DateTime) DO UPDATE SET {update}')
+    values = [agg.index.tolist()]
+    values.extend(agg[column].astype(object).where(agg[column].notna(), None).tolist() for column in agg.columns)
+    con.executemany(sql, zip(*values))
+
+
+def rebuild_rollups(con, table):
+    """Create the rollups of table and fill them from all of its rows."""
+    create_rollups(con, table)
+    start, end = con.execute(f'SELECT MIN(DateTime), MAX(DateTime) FROM "{table}"').fetchone()
+    if start is not None:
+        refresh_rollups(con, table, start, end)
+
+
+def ensure_rollups(con):
+    """Build rollups for managed tables that do not have them yet."""
+    for table in turbine_tables(con):
+        if is_managed(con, table) and create_rollups(con, table):
+            rebuild_rollups(con, table)
+
+
+def to_epoch_ms(values):
+    """datetime64 values -> int64 epoch milliseconds as a NumPy array."""
+    return np.asarray(values, dtype='datetime64[ms]').astype(np.int64)
+
+
+def epoch_ms(text, fmt=QUERY_FORMAT):
+    """'yyyy-MM-dd hh:mm:ss' string (as produced by the date pickers) -> epoch ms."""
+    return calendar.timegm(datetime.strptime(text, fmt).timetuple()) * 1000
+
+
+def migrate_table(con, table):
+    """Rewrite a text-DateTime table into the managed schema and build its rollups.
+
+    Runs in one transaction. Rows with an unparsable DateTime are dropped and
+    duplicates collapse to the first row. Columns the schema does not know are
+    discarded.
+    """
+    existing = table_columns(con, table)
+    channels = [name for name in CHANNELS if name in existing]
+    temp = f'{table}__migrating'
+    # Целые миллисекунды: секунды из strftime('%s') плюс первые три цифры дробной части
+    key = ("CAST(strftime('%s', DateTime) AS INTEGER) * 1000 + "
+           "CAST(substr(substr(DateTime, 21) || '000', 1, 3) AS INTEGER)")
+    with con:
+        con.execute('BEGIN')
+        con.execute(f'DROP TABLE IF EXISTS "{temp}"')
+        create_table(con, temp)
+        columns = ''.join(f', "{name}"' for name in channels)
+        con.execute(f'INSERT OR IGNORE INTO "{temp}" (DateTime{columns}) '
+                    f'SELECT {key}{columns} FROM "{table}" '
+                    f"WHERE strftime('%s', DateTime) IS NOT NULL ORDER BY rowid")
+        con.execute(f'DROP TABLE "{table}"')
+        con.execute(f'ALTER TABLE "{temp}" RENAME TO "{table}"')
+        rebuild_rollups(con, table)
+
+
+def migrate_database(path, progress=print):
+    """Migrate every legacy turbine table in the database at path, then VACUUM."""
+    before = os.path.getsize(path)
+    con = sqlite3.connect(path)
+    try:
+        tables = legacy_tables(con)
+        for table in tables:
+            progress(f'Migrating {table}...')
+            migrate_table(con, table)
+        if tables:
+            con.execute('VACUUM')
+    finally:
+        con.close()
+    progress(f'{path}: {len(tables)} tables migrated, {before / 2 ** 20:.1f} MB -> '
+             f'{os.path.getsize(path) / 2 ** 20:.1f} MB')
+    return tables
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('usage: python turbineSchema.py <database.db>')
+    migrate_database(sys.argv[1])